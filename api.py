@@ -0,0 +1,244 @@
+import json
+from collections import OrderedDict, namedtuple
+from flask import Blueprint, Response, abort, request
+
+import pagination
+from budgets import query_budget
+from export import json_default
+from models import (
+    db,
+    Venue,
+    Artist,
+    Show,
+    venue_genres,
+    artist_genres,
+    load_genre_names
+)
+from search import search
+
+# Versioned JSON API mirroring the HTML read routes, under /api/v1.
+#
+# ``fields=id,name`` selects the fields of each item. Only the columns of
+# the requested fields (plus the id and the sort key) are put in the SELECT;
+# genres, the show timeline and joined venue/artist columns are only
+# queried when asked for. Lists use the same keyset cursors as the HTML
+# pages: pass ``next``/``prev`` back as ``after``/``before``. Searches add
+# the planner's estimate of the total as ``count`` with ``with_count=1``.
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+# columns: field name -> column; genre_owner: link-table column for
+# ``genres``; joins: joined model -> ON clause; sort: keyset order.
+Resource = namedtuple('Resource', 'model columns genre_owner joins sort')
+
+OWNER_COLUMNS = [
+    'id', 'name', 'city', 'state', 'phone', 'image_link', 'facebook_link',
+    'website_link', 'seeking_description', 'upcoming_show_count',
+    'created_date', 'updated_at']
+
+VENUES = Resource(
+    Venue,
+    OrderedDict(
+        (name, getattr(Venue, name))
+        for name in OWNER_COLUMNS + ['address', 'seeking_talent']),
+    venue_genres.c.venue_id,
+    {},
+    [Venue.city, Venue.state, Venue.id])
+
+ARTISTS = Resource(
+    Artist,
+    OrderedDict(
+        (name, getattr(Artist, name))
+        for name in OWNER_COLUMNS + ['seeking_venue']),
+    artist_genres.c.artist_id,
+    {},
+    [Artist.id])
+
+SHOWS = Resource(
+    Show,
+    OrderedDict([
+        ('id', Show.id),
+        ('start_time', Show.start_time),
+        ('venue_id', Show.venue_id),
+        ('venue_name', Venue.name),
+        ('venue_image_link', Venue.image_link),
+        ('artist_id', Show.artist_id),
+        ('artist_name', Artist.name),
+        ('artist_image_link', Artist.image_link),
+    ]),
+    None,
+    {Venue: Show.venue_id == Venue.id, Artist: Show.artist_id == Artist.id},
+    [Show.start_time, Show.id])
+
+# Detail-only fields, filled from Model.query_timeline.
+TIMELINE_FIELDS = [
+    'upcoming_shows', 'past_shows', 'upcoming_shows_count',
+    'past_shows_count']
+
+
+def json_response(payload, status=200):
+    return Response(
+        json.dumps(payload, default=json_default),
+        status=status,
+        mimetype='application/json')
+
+
+def http_error(error):
+    return json_response(
+        {'error': error.name, 'message': error.description}, error.code)
+
+
+# Registered per code: the app's own 400/404/409/500 handlers render HTML
+# and a code match wins over a class match.
+for code in (400, 404, 405, 409, 500):
+    api.register_error_handler(code, http_error)
+
+
+def available_fields(resource, detail=False):
+    fields = list(resource.columns)
+    if resource.genre_owner is not None:
+        fields.append('genres')
+        if detail:
+            fields += TIMELINE_FIELDS
+    return fields
+
+
+def requested_fields(resource, detail=False):
+    available = available_fields(resource, detail)
+    value = request.args.get('fields')
+    if not value:
+        return available
+    fields = list(OrderedDict.fromkeys(
+        name.strip() for name in value.split(',') if name.strip()))
+    unknown = [name for name in fields if name not in available]
+    if unknown:
+        abort(400, f"Unknown fields: {', '.join(unknown)}. "
+                   f"Available: {', '.join(available)}.")
+    return fields
+
+
+def select_columns(resource, fields, extra=()):
+    # Labeled columns for ``fields`` plus ``extra`` (id, sort keys), each
+    # selected once, and the joins they need.
+    columns = OrderedDict()
+    for name in fields:
+        if name in resource.columns:
+            columns[name] = resource.columns[name]
+    for column in extra:
+        columns.setdefault(column.key, column)
+    joins = [model for model in resource.joins
+             if any(column.class_ is model for column in columns.values())]
+    return [column.label(name) for name, column in columns.items()], joins
+
+
+def column_query(resource, fields, extra=()):
+    columns, joins = select_columns(
+        resource, fields, [resource.model.id] + list(extra))
+    query = db.session.query(*columns).select_from(resource.model)
+    for model in joins:
+        query = query.join(model, resource.joins[model])
+    return query
+
+
+def serialize(resource, fields, rows):
+    # Rows to dicts of ``fields``; genres come from one query for all rows.
+    genres = None
+    if 'genres' in fields and rows:
+        genres = load_genre_names(
+            resource.genre_owner, [row.id for row in rows])
+    items = []
+    for row in rows:
+        item = OrderedDict()
+        for name in fields:
+            if name == 'genres':
+                item[name] = genres[row.id]
+            elif name in resource.columns:
+                item[name] = getattr(row, name)
+        items.append(item)
+    return items
+
+
+def page_payload(resource, fields, page, **extra):
+    payload = {'data': serialize(resource, fields, page.items)}
+    payload.update(extra)
+    payload['next'] = page.next_cursor
+    payload['prev'] = page.prev_cursor
+    return payload
+
+
+def list_resource(resource):
+    fields = requested_fields(resource)
+    query = column_query(resource, fields, resource.sort)
+    page = pagination.request_page(
+        query, [pagination.asc(column) for column in resource.sort])
+    return json_response(page_payload(resource, fields, page))
+
+
+def show_resource(resource, ident):
+    fields = requested_fields(resource, detail=True)
+    row = column_query(resource, fields)\
+        .filter(resource.model.id == ident)\
+        .first()
+    if row is None:
+        abort(404)
+    item = serialize(resource, fields, [row])[0]
+    if any(name in TIMELINE_FIELDS for name in fields):
+        timeline = resource.model.query_timeline(ident)
+        for name in fields:
+            if name in TIMELINE_FIELDS:
+                item[name] = timeline[name]
+    return json_response({'data': item})
+
+
+def search_resource(resource):
+    fields = requested_fields(resource)
+    columns, _ = select_columns(resource, fields, [resource.model.id])
+    query, sort = search(
+        resource.model, request.args.get('search_term', ''), columns)
+    page = pagination.request_page(query, sort)
+    extra = {}
+    if pagination.wants_count():
+        extra['count'] = pagination.estimate_count(query)
+    return json_response(page_payload(resource, fields, page, **extra))
+
+
+@api.route('/venues')
+@query_budget(4)
+def venues():
+    return list_resource(VENUES)
+
+
+@api.route('/venues/search')
+@query_budget(5)
+def search_venues():
+    return search_resource(VENUES)
+
+
+@api.route('/venues/<int:venue_id>')
+@query_budget(5)
+def show_venue(venue_id):
+    return show_resource(VENUES, venue_id)
+
+
+@api.route('/artists')
+@query_budget(4)
+def artists():
+    return list_resource(ARTISTS)
+
+
+@api.route('/artists/search')
+@query_budget(5)
+def search_artists():
+    return search_resource(ARTISTS)
+
+
+@api.route('/artists/<int:artist_id>')
+@query_budget(5)
+def show_artist(artist_id):
+    return show_resource(ARTISTS, artist_id)
+
+
+@api.route('/shows')
+@query_budget(3)
+def shows():
+    return list_resource(SHOWS)
@@ -2,27 +2,57 @@
 # Imports
 # ----------------------------------------------------------------------------#
 
-import json
-import sys
+import hashlib
+import hmac
 import dateutil.parser
 import babel
+from functools import lru_cache, wraps
 from flask import (
     Flask,
+    Response,
+    abort,
+    make_response,
     render_template,
     request,
+    session,
     flash,
     redirect,
+    stream_with_context,
     url_for
 )
+from werkzeug.http import is_resource_modified, quote_etag
 from flask_moment import Moment
-import logging
-from logging import Formatter, FileHandler
 
 from sqlalchemy import desc
 from forms import *
 from sqlalchemy.exc import SQLAlchemyError
-from collections import OrderedDict
-from models import Venue, Artist, Show, setup_db
+from models import (
+    Venue,
+    Artist,
+    Show,
+    Genre,
+    venue_genres,
+    artist_genres,
+    setup_db
+)
+from search import search
+from api import api
+from cache import cache
+from engine import pool_stats
+from budgets import query_budget
+from replicas import primary, reads_only
+import replicas
+import assets
+import compression
+import counters
+import export
+import importer
+import logs
+import pagination
+import bench
+import budgets
+import seed
+import telemetry
 
 # ----------------------------------------------------------------------------#
 # App Config.
@@ -31,6 +61,18 @@ from models import Venue, Artist, Show, setup_db
 app = Flask(__name__)
 moment = Moment(app)
 db = setup_db(app)
+logs.init_app(app)
+assets.init_app(app)
+cache.init_app(app)
+telemetry.init_app(app)
+compression.init_app(app)
+budgets.init_app(app)
+counters.init_app(app)
+importer.init_app(app)
+export.init_app(app)
+seed.init_app(app)
+bench.init_app(app)
+app.register_blueprint(api)
 
 # DONE: connect to a local postgresql database
 
@@ -39,26 +81,187 @@ db = setup_db(app)
 # ----------------------------------------------------------------------------#
 
 
-def format_datetime(value, format='medium'):
-    date = dateutil.parser.parse(value)
-    if format == 'full':
-        format = "EEEE MMMM, d, y 'at' h:mma"
-    elif format == 'medium':
-        format = "EE MM, dd, y h:mma"
-    return babel.dates.format_datetime(date, format, locale='en')
+DATETIME_FORMATS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma",
+}
+
+
+@lru_cache(maxsize=None)
+def datetime_pattern(format, locale):
+    # Compiled babel pattern and parsed Locale, resolved once per pair.
+    pattern = DATETIME_FORMATS.get(format, format)
+    return babel.dates.parse_pattern(pattern), babel.Locale.parse(locale)
+
+
+@lru_cache(maxsize=4096)
+def format_datetime_cached(value, format, locale):
+    pattern, locale = datetime_pattern(format, locale)
+    if value.tzinfo is None:
+        # babel.dates.format_datetime treats naive datetimes as UTC.
+        value = value.replace(tzinfo=babel.dates.UTC)
+    return pattern.apply(value, locale)
+
+
+def format_datetime(value, format='medium', locale='en'):
+    if isinstance(value, str):
+        value = dateutil.parser.parse(value)
+    return format_datetime_cached(value, format, locale)
 
 
 app.jinja_env.filters['datetime'] = format_datetime
 
+
+def stream_template(template_name, **context):
+    # Like render_template, but yields the page in chunks as the template
+    # consumes its (possibly lazy) context.
+    app.update_template_context(context)
+    template = app.jinja_env.get_template(template_name)
+    stream = template.stream(context)
+    stream.enable_buffering(app.config['STREAM_BUFFER_SIZE'])
+    return stream
+
+# ----------------------------------------------------------------------------#
+# View data cache.
+# ----------------------------------------------------------------------------#
+
+
+def load_view(model, ident):
+    # The entity's columns and genres as a dict, read through the object
+    # cache under a per-entity version that writes bump (see bump_view).
+    namespace = model.__tablename__.lower()
+
+    def load():
+        # From the primary: a lagging replica would cache stale data under
+        # the new version.
+        with primary():
+            instance = model.query.options(
+                db.noload(model.shows),
+                db.selectinload(model.genre_list)).get(ident)
+            return instance.to_view() if instance is not None else None
+
+    view = cache.get_versioned(namespace, ident, load)
+    if view is None:
+        abort(404)
+    return view
+
+
+def bump_view(model, ident):
+    cache.bump(model.__tablename__.lower(), ident)
+
+
+def admin_only(view):
+    # Pool, cache and route figures are not for the public: the view needs
+    # the ADMIN_TOKEN bearer token and does not exist while it is unset.
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        token = app.config['ADMIN_TOKEN']
+        if not token:
+            abort(404)
+        if not hmac.compare_digest(
+                request.headers.get('Authorization', '').encode(),
+                f'Bearer {token}'.encode()):
+            abort(403)
+        return view(*args, **kwargs)
+    return wrapper
+
+
+@app.route('/cache/stats')
+@admin_only
+def cache_stats():
+    return cache.stats()
+
+
+@app.route('/db/pool/stats')
+@admin_only
+def db_pool_stats():
+    stats = {'primary': pool_stats(db.engine)}
+    for name, replica in replicas.engines(app).items():
+        stats[name] = pool_stats(replica)
+    return stats
+
+
+@app.route('/metrics')
+@admin_only
+def metrics():
+    pools = {'primary': pool_stats(db.engine)}
+    for name, replica in replicas.engines(app).items():
+        pools[name] = pool_stats(replica)
+    return Response(
+        telemetry.exposition(cache.stats(), pools),
+        content_type=telemetry.CONTENT_TYPE)
+
+
+# ----------------------------------------------------------------------------#
+# Conditional GET.
+# ----------------------------------------------------------------------------#
+
+
+def validator_etag(validator):
+    # The ETag of a page validator row; 404 when it is None.
+    # The ETag is weak: the page's bytes also depend on the encoding
+    # compression.py picks, and 200s and 304s must carry the same one.
+    # No Last-Modified: the row's timestamps do not move when a show is
+    # deleted or passes, while its counts do.
+    if validator is None:
+        abort(404)
+    return quote_etag(
+        hashlib.sha1(repr(tuple(validator)).encode()).hexdigest(), weak=True)
+
+
+def not_modified(etag):
+    # Pending flashed messages are rendered into the page, so it is not
+    # the cached one. If-Modified-Since alone never matches.
+    return '_flashes' not in session and not is_resource_modified(
+        request.environ, etag=etag)
+
+
+def conditional_response(etag, body=None):
+    # A 304 without ``body``, else the page; both carry the ETag.
+    response = Response(status=304) if body is None else make_response(body)
+    response.headers['ETag'] = etag
+    response.cache_control.no_cache = True
+    return response
+
+
+def render_conditional(validator, render):
+    # Answers If-None-Match revalidations with a 304 from the validator
+    # row alone; ``render`` (the real queries and the template) only runs
+    # when the page has changed.
+    etag = validator_etag(validator)
+    body = None if not_modified(etag) else render()
+    return conditional_response(etag, body)
+
+
 # ----------------------------------------------------------------------------#
 # Controllers.
 # ----------------------------------------------------------------------------#
 
 
+RECENT_VENUES_KEY = 'home:recent_venues'
+RECENT_ARTISTS_KEY = 'home:recent_artists'
+
+
+def load_recent(model):
+    with primary():
+        rows = db.session.query(model.id, model.name)\
+            .order_by(desc(model.created_date)).limit(10).all()
+    return [{'id': row.id, 'name': row.name} for row in rows]
+
+
+def invalidate_home():
+    # Called after any committed create, edit or delete of a venue/artist.
+    cache.delete(RECENT_VENUES_KEY, RECENT_ARTISTS_KEY)
+
+
 @app.route('/')
+@query_budget(4)
 def index():
-    venues = Venue.query.order_by(desc(Venue.created_date)).limit(10).all()
-    artists = Artist.query.order_by(desc(Artist.created_date)).limit(10).all()
+    ttl = app.config['HOME_CACHE_TTL']
+    venues = cache.get_or_load(
+        RECENT_VENUES_KEY, lambda: load_recent(Venue), ttl)
+    artists = cache.get_or_load(
+        RECENT_ARTISTS_KEY, lambda: load_recent(Artist), ttl)
     return render_template('pages/home.html', venues=venues, artists=artists)
 
 
@@ -66,55 +269,63 @@ def index():
 #  ----------------------------------------------------------------
 
 @app.route('/venues')
+@query_budget(3)
 def venues():
     # DONE: replace with real venues data.
     # DONE: num_upcoming_shows should be aggregated based on number of
-    # upcoming shows per venue.
-    venues = Venue.query.all()
-    d = OrderedDict()
-    for venue in venues:
-        d.setdefault((venue.city, venue.state), list()).append({
-            'id': venue.id,
-            'name': venue.name,
-            'num_upcoming_shows': venue.num_upcoming_shows()
-        })
-    data = [{'city': k[0], 'state': k[1], 'venues': v} for k, v in d.items()]
+    # upcoming shows per venue (kept in Venue.upcoming_show_count).
+    page = pagination.request_page(Venue.query_areas(), [
+        pagination.asc(Venue.city),
+        pagination.asc(Venue.state),
+        pagination.asc(Venue.id)])
+    data = Venue.group_areas(page.items)
 
-    return render_template('pages/venues.html', areas=data)
+    return render_template('pages/venues.html', areas=data, page=page)
 
 
-@app.route('/venues/search', methods=['POST'])
+@app.route('/venues/search', methods=['GET', 'POST'])
+@reads_only
+@query_budget(4)
 def search_venues():
     # DONE: implement search on venues with partial string search. Ensure it is case-insensitive.
     # seach for Hop should return "The Musical Hop".
     # search for "Music" should return "The Musical Hop" and "Park Square Live
     # Music & Coffee"
-    search_term = request.form.get('search_term', '')
-    venues = Venue.query.filter(Venue.name.ilike(f'%{search_term}%')).all()
+    search_term = request.values.get('search_term', '')
+    query, sort = search(Venue, search_term)
+    page = pagination.request_page(
+        query.options(db.noload(Venue.shows)), sort)
+    # The estimate is one more round trip: by default only for the first
+    # page, whose heading shows it.
+    count = pagination.estimate_count(query) if pagination.wants_count(
+        default=page.prev_cursor is None) else None
     response = {
-        "count": len(venues),
+        "count": count,
         "data": [{
             'id': venue.id,
             'name': venue.name,
-            'num_upcoming_shows': venue.num_upcoming_shows(),
-        } for venue in venues]
+            'num_upcoming_shows': venue.upcoming_show_count,
+        } for venue, rank in page.items]
     }
 
     return render_template(
         'pages/search_venues.html',
         results=response,
+        page=page,
         search_term=search_term)
 
 
 @app.route('/venues/<int:venue_id>')
+@query_budget(7)
 def show_venue(venue_id):
     # shows the venue page with the given venue_id
     # DONE: replace with real venue data from the venues table, using venue_id
-    data = Venue.query.get_or_404(venue_id)
-    data.genres = json.loads(data.genres) if data.genres else []
-    data.query_shows()
+    def render():
+        data = dict(load_view(Venue, venue_id))
+        data.update(Venue.query_timeline(venue_id))
+        return render_template('pages/show_venue.html', venue=data)
 
-    return render_template('pages/show_venue.html', venue=data)
+    return render_conditional(Venue.page_validator(venue_id), render)
 
 #  Create Venue
 #  ----------------------------------------------------------------
@@ -127,6 +338,7 @@ def create_venue_form():
 
 
 @app.route('/venues/create', methods=['POST'])
+@query_budget(6)
 def create_venue_submission():
     form = VenueForm(meta={'csrf': False})
     # DONE: insert form data as a new Venue record in the db, instead
@@ -146,7 +358,7 @@ def create_venue_submission():
             state=form.state.data,
             address=form.address.data,
             phone=form.phone.data,
-            genres=json.dumps(form.genres.data),
+            genres=form.genres.data,
             image_link=form.image_link.data,
             facebook_link=form.facebook_link.data,
             website_link=form.website_link.data,
@@ -156,13 +368,15 @@ def create_venue_submission():
 
         db.session.add(venue)
         db.session.commit()
+        invalidate_home()
+        bump_view(Venue, venue.id)
         # on successful db insert, flash success
         flash('Venue ' + venue.name + ' was successfully listed!')
     except SQLAlchemyError:
         # DONE: on unsuccessful db insert, flash an error instead.
         # e.g., flash('An error occurred. Venue ' + data.name + ' could not be
         # listed.')
-        print(sys.exc_info())
+        app.logger.exception('Could not create venue %r', form.name.data)
         db.session.rollback()
         flash(
             'An error occurred. Venue ' +
@@ -175,6 +389,7 @@ def create_venue_submission():
 
 
 @app.route('/venues/<venue_id>', methods=['DELETE'])
+@query_budget(11)
 def delete_venue(venue_id):
     # DONE: Complete this endpoint for taking a venue_id, and using
     # SQLAlchemy ORM to delete a record. Handle cases where the session commit
@@ -188,11 +403,16 @@ def delete_venue(venue_id):
         'message': ''
     }
     try:
-        Venue.query.filter_by(id=venue_id).delete()
+        venue = Venue.query.options(db.selectinload(Venue.shows))\
+            .filter_by(id=venue_id).first()
+        if venue is not None:
+            db.session.delete(venue)
         db.session.commit()
+        invalidate_home()
+        bump_view(Venue, venue_id)
         result['message'] = 'Venue was successfully deleted!'
     except Exception as e:
-        print(sys.exc_info())
+        app.logger.exception('Could not delete venue %s', venue_id)
         db.session.rollback()
         result['status'] = 500
         result['message'] = 'An error occurred. Venue could not be deleted.'
@@ -206,65 +426,81 @@ def delete_venue(venue_id):
 
 
 @app.route('/artists')
+@query_budget(3)
 def artists():
     # DONE: replace with real data returned from querying the database
-    artists = Artist.query.with_entities(
-        Artist.id, Artist.name).order_by('id').all()
-    data = [{'id': artist.id, 'name': artist.name} for artist in artists]
+    page = pagination.request_page(
+        Artist.query.with_entities(Artist.id, Artist.name),
+        [pagination.asc(Artist.id)])
+    data = [{'id': artist.id, 'name': artist.name} for artist in page.items]
 
-    return render_template('pages/artists.html', artists=data)
+    return render_template('pages/artists.html', artists=data, page=page)
 
 
-@app.route('/artists/search', methods=['POST'])
+@app.route('/artists/search', methods=['GET', 'POST'])
+@reads_only
+@query_budget(4)
 def search_artists():
     # DONE: implement search on artists with partial string search. Ensure it is case-insensitive.
     # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
     # search for "band" should return "The Wild Sax Band".
-    search_term = request.form.get('search_term', '')
-    artists = Artist.query.filter(Artist.name.ilike(f'%{search_term}%')).all()
+    search_term = request.values.get('search_term', '')
+    query, sort = search(Artist, search_term)
+    page = pagination.request_page(
+        query.options(db.noload(Artist.shows)), sort)
+    # The estimate is one more round trip: by default only for the first
+    # page, whose heading shows it.
+    count = pagination.estimate_count(query) if pagination.wants_count(
+        default=page.prev_cursor is None) else None
     response = {
-        "count": len(artists),
+        "count": count,
         "data": [{
             'id': artist.id,
             'name': artist.name,
-            'num_upcoming_shows': artist.num_upcoming_shows(),
-        } for artist in artists]
+            'num_upcoming_shows': artist.upcoming_show_count,
+        } for artist, rank in page.items]
     }
     return render_template(
         'pages/search_artists.html',
         results=response,
+        page=page,
         search_term=search_term)
 
 
 @app.route('/artists/<int:artist_id>')
+@query_budget(7)
 def show_artist(artist_id):
     # shows the artist page with the given artist_id
     # DONE: replace with real artist data from the artist table, using
     # artist_id
-    data = Artist.query.get_or_404(artist_id)
-    data.genres = json.loads(data.genres) if data.genres else []
-    data.query_shows()
+    def render():
+        data = dict(load_view(Artist, artist_id))
+        data.update(Artist.query_timeline(artist_id))
+        return render_template('pages/show_artist.html', artist=data)
 
-    return render_template('pages/show_artist.html', artist=data)
+    return render_conditional(Artist.page_validator(artist_id), render)
 
 #  Update
 #  ----------------------------------------------------------------
 
 
 @app.route('/artists/<int:artist_id>/edit', methods=['GET'])
+@query_budget(4)
 def edit_artist(artist_id):
-    artist = Artist.query.get_or_404(artist_id)
-    artist.genres = json.loads(artist.genres) if artist.genres else []
-    form = ArtistForm(obj=artist)
+    artist = load_view(Artist, artist_id)
+    form = ArtistForm(data=artist)
     # DONE: populate form with fields from artist with ID <artist_id>
     return render_template('forms/edit_artist.html', form=form, artist=artist)
 
 
 @app.route('/artists/<int:artist_id>/edit', methods=['POST'])
+@query_budget(8)
 def edit_artist_submission(artist_id):
     # DONE: take values from the form submitted, and update existing
     # artist record with ID <artist_id> using the new attributes
-    artist = Artist.query.get_or_404(artist_id)
+    artist = Artist.query.options(
+        db.noload(Artist.shows),
+        db.selectinload(Artist.genre_list)).get_or_404(artist_id)
     form = ArtistForm(meta={'csrf': False})
 
     if not form.validate():
@@ -280,11 +516,14 @@ def edit_artist_submission(artist_id):
 
     try:
         form.populate_obj(artist)
-        artist.genres = json.dumps(form.genres.data)
+        # Read before the commit expires it, which would cost a reload.
+        name = artist.name
         db.session.commit()
-        flash('Artist ' + artist.name + ' was successfully updated!')
+        invalidate_home()
+        bump_view(Artist, artist_id)
+        flash('Artist ' + name + ' was successfully updated!')
     except SQLAlchemyError:
-        print(sys.exc_info())
+        app.logger.exception('Could not update artist %s', artist_id)
         db.session.rollback()
         flash(
             'An error occurred. Artist ' +
@@ -301,19 +540,22 @@ def edit_artist_submission(artist_id):
 
 
 @app.route('/venues/<int:venue_id>/edit', methods=['GET'])
+@query_budget(4)
 def edit_venue(venue_id):
-    venue = Venue.query.get_or_404(venue_id)
-    venue.genres = json.loads(venue.genres) if venue.genres else []
-    form = VenueForm(obj=venue)
+    venue = load_view(Venue, venue_id)
+    form = VenueForm(data=venue)
     # DONE: populate form with values from venue with ID <venue_id>
     return render_template('forms/edit_venue.html', form=form, venue=venue)
 
 
 @app.route('/venues/<int:venue_id>/edit', methods=['POST'])
+@query_budget(8)
 def edit_venue_submission(venue_id):
     # DONE: take values from the form submitted, and update existing
     # venue record with ID <venue_id> using the new attributes
-    venue = Venue.query.get_or_404(venue_id)
+    venue = Venue.query.options(
+        db.noload(Venue.shows),
+        db.selectinload(Venue.genre_list)).get_or_404(venue_id)
     form = VenueForm(meta={'csrf': False})
 
     if not form.validate():
@@ -326,11 +568,14 @@ def edit_venue_submission(venue_id):
 
     try:
         form.populate_obj(venue)
-        venue.genres = json.dumps(form.genres.data)
+        # Read before the commit expires it, which would cost a reload.
+        name = venue.name
         db.session.commit()
-        flash('Venue ' + venue.name + ' was successfully updated!')
+        invalidate_home()
+        bump_view(Venue, venue_id)
+        flash('Venue ' + name + ' was successfully updated!')
     except SQLAlchemyError:
-        print(sys.exc_info())
+        app.logger.exception('Could not update venue %s', venue_id)
         db.session.rollback()
         flash('An error occurred. Venue ' + venue.name + ' could not updated.')
         return render_template('forms/edit_venue.html', form=form, venue=venue)
@@ -349,6 +594,7 @@ def create_artist_form():
 
 
 @app.route('/artists/create', methods=['POST'])
+@query_budget(6)
 def create_artist_submission():
     # called upon submitting the new artist listing form
     form = ArtistForm(meta={'csrf': False})
@@ -368,7 +614,7 @@ def create_artist_submission():
             city=form.city.data,
             state=form.state.data,
             phone=form.phone.data,
-            genres=json.dumps(form.genres.data),
+            genres=form.genres.data,
             image_link=form.image_link.data,
             facebook_link=form.facebook_link.data,
             website_link=form.website_link.data,
@@ -378,11 +624,13 @@ def create_artist_submission():
 
         db.session.add(artist)
         db.session.commit()
+        invalidate_home()
+        bump_view(Artist, artist.id)
         # on successful db insert, flash success
         flash('Artist ' + artist.name + ' was successfully listed!')
     except SQLAlchemyError as e:
         # DONE: on unsuccessful db insert, flash an error instead.
-        print(sys.exc_info())
+        app.logger.exception('Could not create artist %r', form.name.data)
         db.session.rollback()
         flash(
             'An error occurred. Artist ' +
@@ -399,20 +647,46 @@ def create_artist_submission():
 #  ----------------------------------------------------------------
 
 @app.route('/shows')
+@query_budget(3)
 def shows():
     # displays list of shows at /shows
     # DONE: replace with real venues data.
-    shows = db.session.query(Show, Venue, Artist).join(Venue).join(Artist)
+    page = pagination.request_page(Show.query_listing(), [
+        pagination.asc(Show.start_time),
+        pagination.asc(Show.id)])
     data = [{
-        "venue_id": venue.id,
-        "venue_name": venue.name,
-        "artist_id": artist.id,
-        "artist_name": artist.name,
-        "artist_image_link": artist.image_link,
-        "start_time": str(show.start_time)
-    } for show, venue, artist in shows]
-
-    return render_template('pages/shows.html', shows=data)
+        "venue_id": show.venue_id,
+        "venue_name": show.venue_name,
+        "artist_id": show.artist_id,
+        "artist_name": show.artist_name,
+        "artist_image_link": show.artist_image_link,
+        "start_time": show.start_time
+    } for show in page.items]
+
+    return render_template('pages/shows.html', shows=data, page=page)
+
+
+@app.route('/shows/all')
+@query_budget(3)
+def all_shows():
+    # Streams every show in one page: rows are read from a server-side
+    # cursor in batches and rendered as they arrive, so memory stays flat
+    # and the first bytes go out before the query is exhausted.
+    rows = Show.query_listing()\
+        .order_by(Show.start_time, Show.id)\
+        .execution_options(stream_results=True)\
+        .yield_per(app.config['STREAM_BATCH_SIZE'])
+    data = ({
+        "venue_id": show.venue_id,
+        "venue_name": show.venue_name,
+        "artist_id": show.artist_id,
+        "artist_name": show.artist_name,
+        "artist_image_link": show.artist_image_link,
+        "start_time": show.start_time
+    } for show in rows)
+
+    return Response(stream_with_context(
+        stream_template('pages/shows.html', shows=data, page=None)))
 
 
 @app.route('/shows/create')
@@ -423,6 +697,7 @@ def create_shows():
 
 
 @app.route('/shows/create', methods=['POST'])
+@query_budget(6)
 def create_show_submission():
     # called to create new shows in the db, upon submitting new show listing form
     # DONE: insert form data as a new Show record in the db, instead
@@ -450,7 +725,7 @@ def create_show_submission():
     except SQLAlchemyError:
         # DONE: on unsuccessful db insert, flash an error instead.
         # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
-        print(sys.exc_info())
+        app.logger.exception('Could not create show')
         flash('An error occurred. Show could not be listed.')
         db.session.rollback()
         return render_template('forms/new_show.html', form=form)
@@ -460,6 +735,62 @@ def create_show_submission():
     return render_template('pages/home.html')
 
 
+#  Genres
+#  ----------------------------------------------------------------
+
+@app.route('/genres')
+@query_budget(3)
+def genres():
+    data = Genre.query.order_by(Genre.name).all()
+    return render_template('pages/genres.html', genres=data)
+
+
+@app.route('/genres/<genre>')
+@query_budget(5)
+def show_genre(genre):
+    # Lists are read through the (genre_id, owner_id) link indexes, newest
+    # first, each paged by its own cursor (``venues_after``,
+    # ``artists_after``); the totals are the counters kept on the Genre row.
+    genre = Genre.query.filter_by(name=genre).first_or_404()
+    venue_page = pagination.request_page(
+        db.session.query(Venue.id, Venue.name)
+        .join(venue_genres, venue_genres.c.venue_id == Venue.id)
+        .filter(venue_genres.c.genre_id == genre.id),
+        [pagination.desc(venue_genres.c.venue_id, lambda row: row.id)],
+        prefix='venues_')
+    artist_page = pagination.request_page(
+        db.session.query(Artist.id, Artist.name)
+        .join(artist_genres, artist_genres.c.artist_id == Artist.id)
+        .filter(artist_genres.c.genre_id == genre.id),
+        [pagination.desc(artist_genres.c.artist_id, lambda row: row.id)],
+        prefix='artists_')
+
+    return render_template(
+        'pages/show_genre.html',
+        genre=genre,
+        venues=venue_page.items,
+        venue_page=venue_page,
+        artists=artist_page.items,
+        artist_page=artist_page)
+
+
+#  Export
+#  ----------------------------------------------------------------
+
+@app.route('/export/<any(venues, artists, shows):kind>')
+@query_budget(None)
+def export_ndjson(kind):
+    # Newline-delimited JSON straight from a server-side cursor; see
+    # export.py. ``since`` is an ISO date or datetime.
+    try:
+        since = export.parse_since(request.args.get('since'))
+    except ValueError:
+        abort(400)
+    return Response(
+        stream_with_context(export.ndjson(export.export_rows(kind, since))),
+        mimetype='application/x-ndjson')
+
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
@@ -480,15 +811,6 @@ def dupplicate_resource_error(error):
     return render_template('errors/409.html'), 409
 
 
-if not app.debug:
-    file_handler = FileHandler('error.log')
-    file_handler.setFormatter(Formatter(
-        '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'))
-    app.logger.setLevel(logging.INFO)
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.info('errors')
-
 # ----------------------------------------------------------------------------#
 # Launch.
 # ----------------------------------------------------------------------------#
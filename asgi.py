@@ -0,0 +1,262 @@
+import asyncio
+import io
+import random
+import re
+import sys
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from asgiref.wsgi import WsgiToAsgi
+from flask import render_template, request, session
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app import (
+    app,
+    conditional_response,
+    not_modified,
+    validator_etag
+)
+from cache import cache
+from engine import async_engine_options, async_url, init_engine
+from models import (
+    db,
+    Venue,
+    Artist,
+    Show,
+    venue_genres,
+    artist_genres,
+    build_show_timeline,
+    genre_names_query,
+    group_genre_names,
+    page_validator_query,
+    show_timeline_query
+)
+from replicas import STICKY_KEY
+
+# ASGI entry point: ``uvicorn asgi:application``.
+#
+# The venue and artist detail pages are served here on SQLAlchemy's async
+# engine (asyncpg). Their independent reads (the cached view, upcoming
+# shows, past shows and the page validator) run concurrently, each on its
+# own pooled connection, so latency is the slowest round trip rather than
+# the sum; while they wait the event loop serves other requests. The view
+# (entity row and genres) comes from the same versioned cache as the WSGI
+# views, so writes through either path invalidate it for both. A
+# revalidation (If-None-Match) runs the validator first and answers 304
+# without the other queries, as the WSGI path does.
+#
+# The pages render the same templates inside a Flask request context, so
+# request hooks, sessions and flashed messages behave as under WSGI. Every
+# other route is passed to the Flask app through asgiref's WSGI adapter
+# (a thread pool). Reads go to a random replica from DB_REPLICA_URLS unless
+# the client has just written (see replicas.py).
+#
+# loadtest.py compares this against the WSGI deployment.
+
+Detail = namedtuple(
+    'Detail', 'model owner_column other prefix genre_owner template name')
+
+DETAILS = [
+    (re.compile(r'/venues/(\d+)$'), Detail(
+        Venue, Show.venue_id, Artist, 'artist', venue_genres.c.venue_id,
+        'pages/show_venue.html', 'venue')),
+    (re.compile(r'/artists/(\d+)$'), Detail(
+        Artist, Show.artist_id, Venue, 'venue', artist_genres.c.artist_id,
+        'pages/show_artist.html', 'artist')),
+]
+
+
+class AsyncEngines(object):
+    # The primary's and replicas' async engines, created on first use.
+
+    def __init__(self, config):
+        self.config = config
+        self._primary = None
+        self._replicas = None
+
+    def _create(self, url):
+        engine = create_async_engine(
+            async_url(url, self.config), **async_engine_options(self.config))
+        init_engine(engine.sync_engine, self.config)
+        return engine
+
+    def primary(self):
+        if self._primary is None:
+            self._primary = self._create(
+                self.config['SQLALCHEMY_DATABASE_URI'])
+        return self._primary
+
+    def for_request(self):
+        if self._replicas is None:
+            self._replicas = [
+                self._create(url) for url in self.config['DB_REPLICA_URLS']]
+        if self._replicas and session.get(STICKY_KEY, 0) <= time.time():
+            return random.choice(self._replicas)
+        return self.primary()
+
+    async def dispose(self):
+        for engine in [self._primary] + (self._replicas or []):
+            if engine is not None:
+                await engine.dispose()
+
+
+def closing(environ, start_response):
+    # WsgiToAsgi never calls the body's close(), which runs the response's
+    # call_on_close callbacks (request telemetry).
+    body = app(environ, start_response)
+    try:
+        for chunk in body:
+            yield chunk
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
+
+
+engines = AsyncEngines(app.config)
+wsgi = WsgiToAsgi(closing)
+
+
+async def fetch_all(engine, query):
+    async with engine.connect() as connection:
+        return (await connection.execute(query.statement)).all()
+
+
+async def fetch_first(engine, query):
+    async with engine.connect() as connection:
+        return (await connection.execute(query.limit(1).statement)).first()
+
+
+async def load_view(detail, ident):
+    # app.load_view on the async engine: read from the primary, in the
+    # shape of to_view(), so both paths fill and hit the same cache entries.
+    engine = engines.primary()
+    model = detail.model
+    row, genres = await asyncio.gather(
+        fetch_first(engine, db.session.query(*model.view_columns())
+                    .filter(model.id == ident)),
+        fetch_all(engine, genre_names_query(detail.genre_owner, [ident])))
+    if row is None:
+        return None
+    view = dict(zip([column.key for column in model.view_columns()], row))
+    view['genres'] = group_genre_names(genres, [ident])[ident]
+    return view
+
+
+async def show_detail(detail, ident):
+    engine = engines.for_request()
+    model = detail.model
+    now = datetime.now()
+    validator_query = page_validator_query(
+        model, ident, detail.owner_column, detail.other, now)
+    loads = [
+        cache.get_versioned_async(
+            model.__tablename__.lower(), ident,
+            lambda: load_view(detail, ident)),
+        fetch_all(engine, show_timeline_query(
+            detail.owner_column, ident, detail.other, now, upcoming=True)),
+        fetch_all(engine, show_timeline_query(
+            detail.owner_column, ident, detail.other, now, upcoming=False)),
+    ]
+    if request.if_none_match:
+        etag = validator_etag(await fetch_first(engine, validator_query))
+        if not_modified(etag):
+            return conditional_response(etag)
+        view, upcoming, past = await asyncio.gather(*loads)
+    else:
+        validator, view, upcoming, past = await asyncio.gather(
+            fetch_first(engine, validator_query), *loads)
+        etag = validator_etag(validator)
+    if view is None:
+        # Deleted between the validator and the entity read.
+        return conditional_response(etag, ('', 404))
+
+    data = dict(view)
+    data.update(build_show_timeline(upcoming + past, detail.prefix, now))
+    body = render_template(detail.template, **{detail.name: data})
+    return conditional_response(etag, body)
+
+
+def scope_environ(scope):
+    # A WSGI environ for ``scope`` (no body: only GET/HEAD come here).
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['path'],
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/' + scope.get('http_version', '1.1'),
+        'REMOTE_ADDR': (scope.get('client') or ('',))[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': False,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = 'HTTP_' + name
+        if name in environ:
+            # Cookie headers are split on ';', every other field on ','.
+            separator = '; ' if name == 'HTTP_COOKIE' else ','
+            value = environ[name] + separator + value
+        environ[name] = value
+    return environ
+
+
+async def dispatch(view, scope, send):
+    # Flask's request handling (hooks, error handlers, session saving)
+    # around an async ``view``.
+    with app.request_context(scope_environ(scope)):
+        try:
+            try:
+                rv = app.preprocess_request()
+                if rv is None:
+                    rv = await view()
+            except Exception as e:
+                rv = app.handle_user_exception(e)
+            response = app.finalize_request(rv)
+        except Exception as e:
+            response = app.handle_exception(e)
+    await send({
+        'type': 'http.response.start',
+        'status': response.status_code,
+        'headers': [
+            (name.lower().encode('latin-1'), value.encode('latin-1'))
+            for name, value in response.headers.items()],
+    })
+    await send({
+        'type': 'http.response.body',
+        'body': b'' if scope['method'] == 'HEAD' else response.get_data(),
+    })
+    response.close()
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await engines.dispose()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] == 'http' and scope['method'] in ('GET', 'HEAD'):
+        for pattern, detail in DETAILS:
+            match = pattern.match(scope['path'])
+            if match:
+                ident = int(match.group(1))
+                return await dispatch(
+                    lambda: show_detail(detail, ident), scope, send)
+    return await wsgi(scope, receive, send)
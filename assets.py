@@ -0,0 +1,217 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import shutil
+import time
+
+import click
+from flask import abort, current_app, request, send_from_directory, url_for
+from flask.cli import AppGroup, with_appcontext
+
+# Fingerprinted, precompressed static assets.
+#
+# ``flask assets build`` copies every file under static/ into static/dist/
+# with a content hash in its name (css/main.css -> css/main.3f2a9c1e0b.css),
+# writes .br and .gz variants of the files that compress, and records the
+# mapping in static/dist/manifest.json. url() references between the files
+# (fonts and images in CSS) are rewritten to the hashed names, so a changed
+# file changes the name of every stylesheet that points at it.
+#
+# Templates link files with ``asset_url('css/main.css')``. With a manifest
+# that is /assets/<hashed name>, served with a year of max-age,
+# ``immutable`` and the best encoding the client accepts (br, then gzip);
+# a name never changes content, so browsers do not revalidate until the
+# next deploy changes it. Otherwise, before a build, for files it does not
+# list, and with ASSETS_FINGERPRINT off so edits show up without
+# rebuilding, it is the plain /static/ URL.
+#
+# Run the build before each deploy; fabfile's prepare and deploy do, and
+# commit static/dist/ with it, since Heroku deploys what is in git. The
+# manifest is read when the app starts.
+
+MANIFEST = 'manifest.json'
+MAX_AGE = 365 * 24 * 3600
+
+# Content-Encoding -> file suffix, in order of preference.
+ENCODINGS = {'br': '.br', 'gzip': '.gz'}
+
+# Already compressed formats are not worth another pass.
+COMPRESSIBLE = re.compile(
+    r'^(text/|application/(javascript|json|xml)|image/svg\+xml|'
+    r'font/(ttf|otf)|application/vnd\.ms-fontobject)')
+
+CSS_URL = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+
+
+def build_dir(app):
+    return os.path.join(app.static_folder, 'dist')
+
+
+def content_type(filename):
+    return mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+
+def fingerprint(path, data):
+    root, ext = posixpath.splitext(path)
+    return f'{root}.{hashlib.sha256(data).hexdigest()[:10]}{ext}'
+
+
+def sources(static_folder):
+    # Paths relative to static/, with '/' separators; skips the build
+    # output and dotfiles.
+    for directory, dirs, files in os.walk(static_folder):
+        relative = os.path.relpath(directory, static_folder)
+        if relative == 'dist':
+            dirs[:] = []
+            continue
+        dirs[:] = sorted(name for name in dirs if not name.startswith('.'))
+        for name in sorted(files):
+            if not name.startswith('.'):
+                path = os.path.normpath(os.path.join(relative, name))
+                yield path.replace(os.sep, '/')
+
+
+def rewrite_css(path, text, files):
+    # Points url()s at the hashed names of the files they reference.
+    directory = posixpath.dirname(path)
+
+    def replace(match):
+        quote, target = match.groups()
+        if re.match(r'^([a-z]+:|/|#)', target):
+            return match.group(0)
+        name, suffix = re.match(r'^([^?#]*)(.*)$', target).groups()
+        resolved = posixpath.normpath(posixpath.join(directory, name))
+        if resolved not in files:
+            return match.group(0)
+        hashed = posixpath.relpath(files[resolved], directory or '.')
+        return f'url({quote}{hashed}{suffix}{quote})'
+
+    return CSS_URL.sub(replace, text)
+
+
+def build(static_folder, output, brotli):
+    """Writes the fingerprinted files and their variants to ``output``;
+    returns the manifest.
+    """
+    paths = list(sources(static_folder))
+    # Stylesheets last, so the files they reference already have names.
+    paths.sort(key=lambda path: path.endswith('.css'))
+    files, encodings = {}, {}
+    if os.path.exists(output):
+        shutil.rmtree(output)
+    for path in paths:
+        with open(os.path.join(static_folder, path), 'rb') as source:
+            data = source.read()
+        if path.endswith('.css'):
+            data = rewrite_css(path, data.decode('utf-8'), files)\
+                .encode('utf-8')
+        hashed = fingerprint(path, data)
+        files[path] = hashed
+        target = os.path.join(output, hashed)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, 'wb') as out:
+            out.write(data)
+        if not COMPRESSIBLE.match(content_type(path)):
+            continue
+        variants = {
+            'br': brotli.compress(data, quality=11),
+            # mtime=0 keeps the output identical across builds.
+            'gzip': gzip.compress(data, compresslevel=9, mtime=0),
+        }
+        encodings[hashed] = []
+        for encoding, compressed in variants.items():
+            if len(compressed) < len(data):
+                with open(target + ENCODINGS[encoding], 'wb') as out:
+                    out.write(compressed)
+                encodings[hashed].append(encoding)
+    manifest = {'files': files, 'encodings': encodings}
+    with open(os.path.join(output, MANIFEST), 'w') as out:
+        json.dump(manifest, out, indent=1, sort_keys=True)
+    return manifest
+
+
+def load_manifest(app):
+    try:
+        with open(os.path.join(build_dir(app), MANIFEST)) as source:
+            manifest = json.load(source)
+    except FileNotFoundError:
+        return None
+    return index(manifest)
+
+
+def index(manifest):
+    # The hashed names /assets/ may serve.
+    manifest['served'] = set(manifest['files'].values())
+    return manifest
+
+
+def asset_url(filename):
+    manifest = current_app.extensions['assets']
+    if manifest is None or not current_app.config['ASSETS_FINGERPRINT'] \
+            or filename not in manifest['files']:
+        return url_for('static', filename=filename)
+    return url_for('asset', filename=manifest['files'][filename])
+
+
+def serve_asset(filename):
+    manifest = current_app.extensions['assets']
+    if manifest is None or filename not in manifest['served']:
+        abort(404)
+    available = manifest['encodings'].get(filename, [])
+    encoding = None
+    for candidate in ENCODINGS:
+        if candidate in available and \
+                request.accept_encodings.quality(candidate) > 0:
+            encoding = candidate
+            break
+    path = filename + ENCODINGS[encoding] if encoding else filename
+    response = send_from_directory(
+        build_dir(current_app), path, mimetype=content_type(filename),
+        max_age=MAX_AGE, etag=path)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    if available:
+        response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+def init_app(app):
+    app.extensions['assets'] = load_manifest(app)
+    app.add_url_rule('/assets/<path:filename>', 'asset', serve_asset)
+    app.jinja_env.globals['asset_url'] = asset_url
+    app.cli.add_command(assets_cli)
+
+
+assets_cli = AppGroup('assets', help='Static assets.')
+
+
+@assets_cli.command('build')
+@with_appcontext
+def build_command():
+    """Fingerprint and precompress static/ into static/dist/."""
+    try:
+        import brotli
+    except ImportError:
+        raise click.ClickException(
+            'Building assets needs the brotli package (pip install brotli)')
+    start = time.perf_counter()
+    app = current_app
+    manifest = build(app.static_folder, build_dir(app), brotli)
+    app.extensions['assets'] = index(manifest)
+    size = sum(
+        os.path.getsize(os.path.join(app.static_folder, path))
+        for path in manifest['files'])
+    compressed = sum(
+        min(os.path.getsize(os.path.join(
+            build_dir(app), hashed + ENCODINGS.get(encoding, '')))
+            for encoding in manifest['encodings'].get(hashed, []) + [None])
+        for hashed in manifest['files'].values())
+    click.echo(
+        f"{len(manifest['files'])} files, {size} bytes, {compressed} bytes "
+        f"as served with brotli, in {time.perf_counter() - start:.1f}s.")
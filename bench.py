@@ -0,0 +1,513 @@
+import json
+import random
+import resource
+import secrets
+import sys
+import time
+from collections import Counter, namedtuple
+from datetime import datetime, timedelta
+
+import babel.dates
+import click
+import dateutil.parser
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+import pagination
+from loadtest import percentile
+from models import db, Venue, Artist, Show, Genre
+from search import search
+from seed import Generator
+
+# Benchmarks: ``flask bench routes|venues|search|datetime``.
+#
+# ``routes`` drives every route through the test client against whatever
+# database the app is configured with, typically one filled by ``flask
+# seed``. Path parameters are drawn at random from existing rows. For each
+# route it reports latency percentiles, throughput, SQL statements per
+# request against the route's query budget (budgets.py) and the peak RSS
+# while the route ran. --writes adds the POST/DELETE routes, which create,
+# edit and delete rows. --check exits with status 1 when a route failed or
+# went over its budget.
+#
+# ``venues``, ``search`` and ``datetime`` compare the current code paths
+# with the ones they replaced: the per-venue COUNT listing, the ilike name
+# search and the parse-and-format datetime filter.
+#
+# Every command prints one JSON object per line, carrying --label and the
+# row counts, so runs at different scales or commits can be concatenated
+# and compared. A volume comparison is one run per scale:
+#
+#     flask seed --scale 1k && flask bench routes --label 1k
+#     (new database) flask seed --scale 100k && flask bench routes ...
+#
+# To compare the WSGI and ASGI deployments (asgi.py) under concurrent
+# load, use loadtest.py against both servers.
+
+bench_cli = AppGroup('bench', help='Benchmarks.')
+
+# path: format string over the Sample parameters; data: form fields for
+# POST, given the Sample parameters.
+Route = namedtuple('Route', 'endpoint method path data write')
+
+ROUTES = [
+    Route('index', 'GET', '/', None, False),
+    Route('venues', 'GET', '/venues', None, False),
+    Route('search_venues', 'GET', '/venues/search?search_term={term}',
+          None, False),
+    Route('search_venues', 'POST', '/venues/search',
+          lambda params: {'search_term': params['term']}, False),
+    Route('show_venue', 'GET', '/venues/{venue_id}', None, False),
+    Route('create_venue_form', 'GET', '/venues/create', None, False),
+    Route('edit_venue', 'GET', '/venues/{venue_id}/edit', None, False),
+    Route('artists', 'GET', '/artists', None, False),
+    Route('search_artists', 'GET', '/artists/search?search_term={term}',
+          None, False),
+    Route('search_artists', 'POST', '/artists/search',
+          lambda params: {'search_term': params['term']}, False),
+    Route('show_artist', 'GET', '/artists/{artist_id}', None, False),
+    Route('create_artist_form', 'GET', '/artists/create', None, False),
+    Route('edit_artist', 'GET', '/artists/{artist_id}/edit', None, False),
+    Route('shows', 'GET', '/shows', None, False),
+    Route('all_shows', 'GET', '/shows/all', None, False),
+    Route('create_shows', 'GET', '/shows/create', None, False),
+    Route('genres', 'GET', '/genres', None, False),
+    Route('show_genre', 'GET', '/genres/{genre}', None, False),
+    Route('export_ndjson', 'GET', '/export/venues?since={since}', None,
+          False),
+    Route('export_ndjson', 'GET', '/export/artists?since={since}', None,
+          False),
+    Route('export_ndjson', 'GET', '/export/shows?since={since}', None,
+          False),
+    Route('cache_stats', 'GET', '/cache/stats', None, False),
+    Route('db_pool_stats', 'GET', '/db/pool/stats', None, False),
+    Route('metrics', 'GET', '/metrics', None, False),
+    Route('api.venues', 'GET', '/api/v1/venues', None, False),
+    Route('api.search_venues', 'GET', '/api/v1/venues/search?search_term='
+          '{term}', None, False),
+    Route('api.show_venue', 'GET', '/api/v1/venues/{venue_id}', None,
+          False),
+    Route('api.artists', 'GET', '/api/v1/artists', None, False),
+    Route('api.search_artists', 'GET', '/api/v1/artists/search?'
+          'search_term={term}', None, False),
+    Route('api.show_artist', 'GET', '/api/v1/artists/{artist_id}', None,
+          False),
+    Route('api.shows', 'GET', '/api/v1/shows', None, False),
+    Route('create_venue_submission', 'POST', '/venues/create',
+          lambda params: params['venue_form'], True),
+    Route('edit_venue_submission', 'POST', '/venues/{venue_id}/edit',
+          lambda params: params['venue_form'], True),
+    Route('create_artist_submission', 'POST', '/artists/create',
+          lambda params: params['artist_form'], True),
+    Route('edit_artist_submission', 'POST', '/artists/{artist_id}/edit',
+          lambda params: params['artist_form'], True),
+    Route('create_show_submission', 'POST', '/shows/create',
+          lambda params: {
+              'venue_id': params['venue_id'],
+              'artist_id': params['artist_id'],
+              'start_time': params['start_time']}, True),
+    # Deletes the venues created above, one per request.
+    Route('delete_venue', 'DELETE', '/venues/{created_venue_id}', None,
+          True),
+]
+
+# Sampled path parameters per route.
+SAMPLE_SIZE = 500
+SEARCH_TERMS = ['hop', 'the musical', 'blue', 'new york', 'jazz', 'san fr']
+BENCH_NAME = 'Bench venue'
+
+
+class Sample(object):
+    # Random path parameters and form data drawn from existing rows.
+
+    def __init__(self, seed):
+        self.random = random.Random(seed)
+        self.generator = Generator(seed, datetime.now())
+        self.venue_ids = self.sample_ids(Venue)
+        self.artist_ids = self.sample_ids(Artist)
+        self.genres = [name for (name,) in db.session.query(Genre.name)]
+        self.created_venue_ids = []
+        self.number = 0
+
+    def sample_ids(self, model):
+        return [ident for (ident,) in db.session.query(model.id)
+                .order_by(db.func.random()).limit(SAMPLE_SIZE)]
+
+    def form(self, row, genres):
+        data = {key: value for key, value in row.items()
+                if key not in ('import_key', 'created_date', 'updated_at')}
+        for key in ('seeking_talent', 'seeking_venue'):
+            if key in data:
+                data[key] = 'y' if data[key] else ''
+        data['genres'] = genres
+        return data
+
+    def params(self):
+        self.number += 1
+        venue_row, venue_genres = self.generator.venue(self.number)
+        venue_row['name'] = f'{BENCH_NAME} {self.number}'
+        artist_row, artist_genres = self.generator.artist(self.number)
+        return {
+            'venue_id': self.random.choice(self.venue_ids or [0]),
+            'artist_id': self.random.choice(self.artist_ids or [0]),
+            'created_venue_id': (
+                self.created_venue_ids.pop()
+                if self.created_venue_ids else 0),
+            'genre': self.random.choice(self.genres or ['Jazz']),
+            'term': self.random.choice(SEARCH_TERMS),
+            'since': (datetime.now() - timedelta(days=30)).date().isoformat(),
+            'start_time': self.generator.start_time().strftime(
+                '%Y-%m-%d %H:%M:%S'),
+            'venue_form': self.form(venue_row, venue_genres),
+            'artist_form': self.form(artist_row, artist_genres),
+        }
+
+    def collect_created_venues(self):
+        self.created_venue_ids = [
+            ident for (ident,) in db.session.query(Venue.id)
+            .filter(Venue.name.like(f'{BENCH_NAME} %'))]
+        db.session.remove()
+
+
+class StatementCounter(object):
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, *args):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(Engine, 'after_cursor_execute', self)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(Engine, 'after_cursor_execute', self)
+
+
+def reset_peak_rss():
+    # Linux: writing 5 to clear_refs resets VmHWM, the peak RSS.
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_kb(reset):
+    if reset:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    # Peak of the whole process (kilobytes on Linux).
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def summary(latencies, statements, elapsed):
+    ordered = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'rps': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'p50_ms': percentile(ordered, 0.50),
+        'p95_ms': percentile(ordered, 0.95),
+        'p99_ms': percentile(ordered, 0.99),
+        'max_ms': percentile(ordered, 1.0),
+        'sql_mean': (round(sum(statements) / len(statements), 1)
+                     if statements else None),
+        'sql_max': max(statements) if statements else None,
+    }
+
+
+def dataset(label):
+    return {
+        'label': label,
+        'dialect': db.engine.dialect.name,
+        'venues': db.session.query(db.func.count(Venue.id)).scalar(),
+        'artists': db.session.query(db.func.count(Artist.id)).scalar(),
+        'shows': db.session.query(db.func.count(Show.id)).scalar(),
+    }
+
+
+def emit(output, record):
+    output.write(json.dumps(record) + '\n')
+    output.flush()
+
+
+def measure(run, requests, warmup):
+    # Calls run() warmup + requests times; returns the measured latencies,
+    # statement counts and wall time.
+    latencies, statements = [], []
+    with StatementCounter() as counter:
+        for _ in range(warmup):
+            run()
+        start = time.perf_counter()
+        for _ in range(requests):
+            before = counter.count
+            call_start = time.perf_counter()
+            run()
+            latencies.append(time.perf_counter() - call_start)
+            statements.append(counter.count - before)
+        elapsed = time.perf_counter() - start
+    return latencies, statements, elapsed
+
+
+def uncovered_routes(app):
+    covered = {(route.endpoint, route.method) for route in ROUTES}
+    missing = []
+    for rule in app.url_map.iter_rules():
+        if rule.endpoint in ('static', 'asset'):
+            continue
+        for method in rule.methods - {'HEAD', 'OPTIONS'}:
+            if (rule.endpoint, method) not in covered:
+                missing.append(f'{method} {rule.rule}')
+    return sorted(missing)
+
+
+def route_budget(app, endpoint):
+    view = app.view_functions.get(endpoint)
+    return getattr(view, 'query_budget', app.config['QUERY_BUDGET_DEFAULT'])
+
+
+def admin_headers(app):
+    # Sent with every route, for the ADMIN_TOKEN ones (app.admin_only).
+    return {'Authorization': f'Bearer {app.config["ADMIN_TOKEN"]}'}
+
+
+def bench_route(app, client, sample, route, requests, warmup):
+    statuses = Counter()
+    errors = []
+
+    def run():
+        params = sample.params()
+        path = route.path.format(**params)
+        data = route.data(params) if route.data else None
+        try:
+            response = client.open(
+                path, method=route.method, data=data,
+                headers=admin_headers(app))
+            response.get_data()
+            response.close()
+            statuses[response.status_code] += 1
+            if response.status_code >= 500:
+                errors.append(f'HTTP {response.status_code}')
+        except Exception as e:
+            errors.append(f'{type(e).__name__}: {e}'.splitlines()[0])
+
+    reset = reset_peak_rss()
+    latencies, statements, elapsed = measure(run, requests, warmup)
+    budget = route_budget(app, route.endpoint)
+    record = {
+        'endpoint': route.endpoint,
+        'method': route.method,
+        'path': route.path,
+        'status': {str(code): count for code, count in statuses.items()},
+        'errors': len(errors),
+    }
+    record.update(summary(latencies, statements, elapsed))
+    record['budget'] = budget
+    record['over_budget'] = (
+        budget is not None and record['sql_max'] is not None
+        and record['sql_max'] > budget)
+    record['peak_rss_kb'] = peak_rss_kb(reset)
+    if errors:
+        record['first_error'] = errors[0]
+    return record
+
+
+@bench_cli.command('routes')
+@click.option('--requests', type=int, default=20, show_default=True,
+              help='Measured requests per route.')
+@click.option('--warmup', type=int, default=2, show_default=True,
+              help='Unmeasured requests per route first.')
+@click.option('--only', multiple=True,
+              help='Endpoint to run (repeatable), e.g. show_venue.')
+@click.option('--writes', is_flag=True,
+              help='Also run the routes that create, edit and delete rows.')
+@click.option('--check', is_flag=True,
+              help='Exit with status 1 if a route failed or went over its '
+                   'query budget.')
+@click.option('--seed', 'seed_value', type=int, default=1, show_default=True)
+@click.option('--label', default='', help='Copied into every record.')
+@click.option('--output', type=click.File('w'), default='-',
+              help='Output file. Default: stdout.')
+def routes_command(requests, warmup, only, writes, check, seed_value, label,
+                   output):
+    """Latency, SQL statements and peak RSS of every route."""
+    app = current_app._get_current_object()
+    for route in uncovered_routes(app):
+        click.echo(f'Not benchmarked: {route}', err=True)
+    base = dataset(label)
+    sample = Sample(seed_value)
+    db.session.remove()
+    config = dict(app.config)
+    # Budgets are reported, not enforced, so every route runs to the end.
+    app.config.update(QUERY_BUDGET_ENFORCE=False, WTF_CSRF_ENABLED=False)
+    if not app.config['ADMIN_TOKEN']:
+        app.config['ADMIN_TOKEN'] = secrets.token_urlsafe()
+    failed = []
+    try:
+        client = app.test_client()
+        for route in ROUTES:
+            if route.write and not writes:
+                continue
+            if only and route.endpoint not in only:
+                continue
+            if route.endpoint == 'delete_venue':
+                sample.collect_created_venues()
+            record = dict(base)
+            record.update(bench_route(
+                app, client, sample, route, requests, warmup))
+            emit(output, record)
+            if record['errors'] or record['over_budget']:
+                failed.append(f'{route.method} {route.path}')
+    finally:
+        app.config.clear()
+        app.config.update(config)
+    if check and failed:
+        click.echo(f'Failed or over budget: {", ".join(failed)}', err=True)
+        sys.exit(1)
+
+
+@bench_cli.command('venues')
+@click.option('--requests', type=int, default=5, show_default=True)
+@click.option('--label', default='')
+@click.option('--output', type=click.File('w'), default='-')
+def venues_command(requests, label, output):
+    """The /venues listing: keyset pages vs per-venue COUNTs.
+
+    ``keyset_page`` is one page; ``all_rows`` and ``all_pages`` read every
+    venue, as ``per_venue_counts`` (the original listing) does: in one
+    grouped query, and page by page through the cursors.
+    """
+    now = datetime.now()
+    sort = [
+        pagination.asc(Venue.city),
+        pagination.asc(Venue.state),
+        pagination.asc(Venue.id)]
+
+    def page():
+        rows = pagination.keyset_page(Venue.query_areas(), sort).items
+        Venue.group_areas(rows)
+        db.session.remove()
+
+    def all_rows():
+        rows = Venue.query_areas()\
+            .order_by(Venue.city, Venue.state, Venue.id).all()
+        Venue.group_areas(rows)
+        db.session.remove()
+
+    def all_pages():
+        cursor = None
+        while True:
+            page = pagination.keyset_page(
+                Venue.query_areas(), sort, after=cursor)
+            Venue.group_areas(page.items)
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+        db.session.remove()
+
+    def per_venue_counts():
+        # The original listing: every venue with its shows joined, then one
+        # COUNT per venue.
+        venues = Venue.query.options(db.joinedload(Venue.shows)).all()
+        for venue in venues:
+            db.session.query(Show).filter(
+                Show.venue_id == venue.id, Show.start_time > now).count()
+        db.session.remove()
+
+    base = dataset(label)
+    for name, run in (('keyset_page', page),
+                      ('all_rows', all_rows),
+                      ('all_pages', all_pages),
+                      ('per_venue_counts', per_venue_counts)):
+        record = dict(base, benchmark='venues', path=name)
+        record.update(summary(*measure(run, requests, 1)))
+        emit(output, record)
+
+
+@bench_cli.command('search')
+@click.option('--term', 'terms', multiple=True,
+              help='Search term (repeatable). Default: a built-in set.')
+@click.option('--requests', type=int, default=20, show_default=True)
+@click.option('--label', default='')
+@click.option('--output', type=click.File('w'), default='-')
+def search_command(terms, requests, label, output):
+    """Ranked full-text/trigram search vs name ILIKE."""
+    base = dataset(label)
+    for model in (Venue, Artist):
+        for term in terms or SEARCH_TERMS:
+            results = {}
+
+            def ranked():
+                query, sort = search(model, term)
+                results['ranked'] = len(
+                    pagination.keyset_page(query, sort).items)
+                db.session.remove()
+
+            def ilike():
+                # The original search: every match, unranked.
+                results['ilike'] = len(
+                    model.query.filter(model.name.ilike(f'%{term}%')).all())
+                db.session.remove()
+
+            for name, run in (('ranked', ranked), ('ilike', ilike)):
+                record = dict(base, benchmark='search', path=name,
+                              model=model.__tablename__, term=term)
+                record.update(summary(*measure(run, requests, 1)))
+                record['rows'] = results[name]
+                emit(output, record)
+
+
+@bench_cli.command('datetime')
+@click.option('--calls', type=int, default=2000, show_default=True)
+@click.option('--format', 'format', type=click.Choice(['medium', 'full']),
+              default='full', show_default=True)
+@click.option('--label', default='')
+@click.option('--output', type=click.File('w'), default='-')
+def datetime_command(calls, format, label, output):
+    """The datetime template filter vs parsing and formatting every call."""
+    # Imported here: app imports this module.
+    from app import DATETIME_FORMATS, format_datetime, format_datetime_cached
+    rng = random.Random(1)
+    now = datetime.now().replace(second=0, microsecond=0)
+    # Show times repeat: a page lists a few hundred distinct ones.
+    values = [now + timedelta(days=rng.randint(0, 300), hours=20)
+              for _ in range(calls)]
+
+    def parse_and_format():
+        for value in values:
+            babel.dates.format_datetime(
+                dateutil.parser.parse(str(value)),
+                DATETIME_FORMATS[format], locale='en')
+
+    def cold_filter():
+        format_datetime_cached.cache_clear()
+        for value in values:
+            format_datetime(value, format)
+
+    def warm_filter():
+        for value in values:
+            format_datetime(value, format)
+
+    for name, run in (('parse_and_format', parse_and_format),
+                      ('filter_cold', cold_filter),
+                      ('filter_warm', warm_filter)):
+        latencies, statements, elapsed = measure(run, 5, 1)
+        ordered = sorted(latencies)
+        emit(output, {
+            'label': label,
+            'benchmark': 'datetime',
+            'path': name,
+            'calls': calls,
+            'format': format,
+            'per_call_us': round(ordered[len(ordered) // 2] / calls * 1e6, 2),
+        })
+
+
+def init_app(app):
+    app.cli.add_command(bench_cli)
@@ -0,0 +1,134 @@
+import re
+from collections import Counter
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Query budgets: the most SQL statements a request may run.
+#
+# A view declares its budget with @query_budget(n) (None: unlimited, e.g.
+# for exports that read in batches); other views get QUERY_BUDGET_DEFAULT.
+# Budgets are enforced when QUERY_BUDGET_ENFORCE is set, or, if it is None,
+# in debug and testing mode: the statement that goes over the budget raises
+# QueryBudgetExceeded, naming the statement shapes the request repeated,
+# which is where an N+1 pattern shows up. A view that swallows the error
+# still fails, from after_request.
+#
+# Budgets are per request and independent of the data: a list page runs
+# the same statements for 5 rows as for 50. They sit two statements above
+# what each view runs now, so a cache miss or one more lookup does not
+# fail a request, while a query per row of a page still does. Statements
+# executed with the ``connection_setup`` execution option (engine.py's SET
+# LOCAL statement_timeout at the start of every transaction under
+# PgBouncer) are not the view's and are not counted.
+
+SHAPE_LENGTH = 300
+
+# Bound parameters in the DBAPI paramstyles used here (qmark, pyformat,
+# numeric), and expanded IN lists of them.
+PARAMETER = r'(?:\?|%\(\w+\)s|%s|\$\d+)'
+PARAMETER_LIST = re.compile(
+    r'\(\s*' + PARAMETER + r'(?:\s*,\s*' + PARAMETER + r')*\s*\)')
+WHITESPACE = re.compile(r'\s+')
+SELECT_LIST = re.compile(r'^SELECT (.+?) FROM ')
+
+
+class QueryBudgetExceeded(RuntimeError):
+    pass
+
+
+class Budget(object):
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.shapes = Counter()
+        self.count = 0
+        self.error = None
+
+
+def query_budget(limit):
+    # Sets the view's statement budget.
+    def decorator(view):
+        view.query_budget = limit
+        return view
+    return decorator
+
+
+def statement_shape(statement):
+    # The statement with whitespace collapsed and IN lists of any length
+    # made equal, so repeats of one query group together.
+    shape = WHITESPACE.sub(' ', statement).strip()
+    return PARAMETER_LIST.sub('(...)', shape)
+
+
+def enforced(app):
+    enforce = app.config['QUERY_BUDGET_ENFORCE']
+    if enforce is None:
+        return app.debug or app.testing
+    return enforce
+
+
+def current_budget():
+    if has_request_context():
+        return g.get('query_budget')
+    return None
+
+
+def report(budget):
+    lines = [
+        f'{request.method} {request.path} ran {budget.count} SQL statements, '
+        f'over its budget of {budget.limit} '
+        f'(endpoint {request.endpoint}).']
+    repeated = [
+        (count, shape) for shape, count in budget.shapes.most_common()
+        if count > 1]
+    if not repeated:
+        lines.append('No statement was repeated.')
+    else:
+        lines.append('Repeated statements:')
+    for count, shape in repeated:
+        # The FROM and WHERE clauses say more than the column list.
+        shape = SELECT_LIST.sub('SELECT ... FROM ', shape, count=1)
+        if len(shape) > SHAPE_LENGTH:
+            shape = shape[:SHAPE_LENGTH] + '...'
+        lines.append(f'  {count} x {shape}')
+    return '\n'.join(lines)
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    budget = current_budget()
+    if budget is None:
+        return
+    if context is not None and \
+            context.execution_options.get('connection_setup'):
+        return
+    budget.count += 1
+    budget.shapes[statement_shape(statement)] += 1
+    if budget.count > budget.limit and budget.error is None:
+        budget.error = QueryBudgetExceeded(report(budget))
+        raise budget.error
+
+
+def init_app(app):
+    if not event.contains(Engine, 'before_cursor_execute',
+                          before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+
+    @app.before_request
+    def start_budget():
+        if not enforced(app):
+            return
+        view = app.view_functions.get(request.endpoint)
+        limit = getattr(
+            view, 'query_budget', app.config['QUERY_BUDGET_DEFAULT'])
+        if limit is not None:
+            g.query_budget = Budget(limit)
+
+    @app.after_request
+    def check_budget(response):
+        budget = g.get('query_budget')
+        if budget is not None and budget.error is not None:
+            raise budget.error
+        return response
@@ -0,0 +1,159 @@
+import pickle
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+
+# Read-through cache for data that changes only on writes.
+#
+# Two backends share one small interface (get/set/delete):
+# LRUCache keeps entries in process, bounded by entry count; RedisCache
+# talks to a Redis server (docker-compose runs one locally) so every worker
+# sees the same entries and versions. CACHE_BACKEND selects one.
+#
+# Per-object entries use versioned keys: ``venue:3`` is stored under
+# ``venue:3:<version>`` where the version is a random token read from
+# ``venue:3:version``. A write replaces the token, which makes every older
+# entry unreachable at once; they then age out through the LRU bound or the
+# TTL. Tokens never repeat, so losing a version key (eviction, expiry, a
+# Redis restart) can only cause a miss, never a stale hit.
+
+
+class LRUCache(object):
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires is not None and expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+
+class RedisCache(object):
+
+    def __init__(self, url):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError(
+                "CACHE_BACKEND = 'redis' needs the redis package "
+                "(pip install redis)")
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        value = self._client.get(key)
+        return None if value is None else pickle.loads(value)
+
+    def set(self, key, value, ttl=None):
+        self._client.set(key, pickle.dumps(value), ex=ttl or None)
+
+    def delete(self, *keys):
+        if keys:
+            self._client.delete(*keys)
+
+
+class Cache(object):
+
+    def __init__(self):
+        self.backend = LRUCache()
+        self.default_ttl = None
+        self._lock = threading.Lock()
+        self._hits = Counter()
+        self._misses = Counter()
+
+    def init_app(self, app):
+        if app.config['CACHE_BACKEND'] == 'redis':
+            self.backend = RedisCache(app.config['CACHE_URL'])
+        else:
+            self.backend = LRUCache(app.config['CACHE_MAX_ENTRIES'])
+        self.default_ttl = app.config['CACHE_DEFAULT_TTL']
+
+    def _count(self, namespace, hit):
+        with self._lock:
+            (self._hits if hit else self._misses)[namespace] += 1
+
+    def get_or_load(self, key, loader, ttl=None, namespace=None):
+        # ``loader`` runs on a miss; a None result is returned but not
+        # stored.
+        value = self.backend.get(key)
+        self._count(namespace or key.split(':', 1)[0], value is not None)
+        if value is None:
+            value = loader()
+            if value is not None:
+                self.backend.set(key, value, ttl or self.default_ttl)
+        return value
+
+    def delete(self, *keys):
+        self.backend.delete(*keys)
+
+    def versioned_key(self, namespace, ident, ttl=None):
+        version_key = f'{namespace}:{ident}:version'
+        version = self.backend.get(version_key)
+        if version is None:
+            version = uuid.uuid4().hex
+            self.backend.set(version_key, version, ttl or self.default_ttl)
+        return f'{namespace}:{ident}:{version}'
+
+    def get_versioned(self, namespace, ident, loader, ttl=None):
+        return self.get_or_load(
+            self.versioned_key(namespace, ident, ttl), loader, ttl, namespace)
+
+    async def get_versioned_async(self, namespace, ident, loader, ttl=None):
+        # get_versioned for the ASGI views: ``loader`` is a coroutine
+        # function. The backend calls are not awaited; they are an
+        # in-process lookup or a Redis round trip, which holds up the event
+        # loop about as long as a query's bookkeeping does.
+        key = self.versioned_key(namespace, ident, ttl)
+        value = self.backend.get(key)
+        self._count(namespace, value is not None)
+        if value is None:
+            value = await loader()
+            if value is not None:
+                self.backend.set(key, value, ttl or self.default_ttl)
+        return value
+
+    def bump(self, namespace, ident):
+        self.backend.set(
+            f'{namespace}:{ident}:version',
+            uuid.uuid4().hex,
+            self.default_ttl)
+
+    def stats(self):
+        with self._lock:
+            namespaces = set(self._hits) | set(self._misses)
+            stats = {}
+            for namespace in sorted(namespaces):
+                hits = self._hits[namespace]
+                misses = self._misses[namespace]
+                stats[namespace] = {
+                    'hits': hits,
+                    'misses': misses,
+                    'hit_ratio': hits / (hits + misses),
+                }
+            return stats
+
+
+cache = Cache()
@@ -0,0 +1,152 @@
+import gzip
+import zlib
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Response compression.
+#
+# Responses whose type is in COMPRESS_MIMETYPES are sent with brotli or
+# gzip, whichever the client prefers (brotli on a tie, when the brotli
+# package is installed). Buffered bodies shorter than COMPRESS_MIN_SIZE
+# are sent as they are. Streamed bodies (the streamed templates, the NDJSON
+# exports) are compressed chunk by chunk as the app yields them, and
+# nothing is buffered beyond the compressor's window. The first chunk is
+# flushed at once, so the time to first byte does not change; after that
+# the output is flushed every COMPRESS_STREAM_FLUSH_SIZE bytes of input,
+# since a flush per small template chunk costs both ratio and CPU.
+#
+# Responses that are already encoded, served from files (send_file: the
+# precompressed assets, static/), partial, or marked no-transform are left
+# alone. The pages' ETags are weak (app.validator_etag), since their
+# bytes depend on the encoding; conditional GETs compare weakly.
+#
+# The settings of each encoding are resolved once. The compressors
+# themselves cannot be reused: Python's zlib and brotli objects cannot be
+# reset after a stream is finished, so each streamed response gets its own,
+# and buffered bodies use the one-shot functions.
+
+
+class GzipStream(object):
+
+    def __init__(self, level):
+        # wbits 31: gzip header and trailer.
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data, flush):
+        data = self.compressor.compress(data)
+        if flush:
+            data += self.compressor.flush(zlib.Z_SYNC_FLUSH)
+        return data
+
+    def finish(self):
+        return self.compressor.flush()
+
+
+class BrotliStream(object):
+
+    def __init__(self, quality):
+        self.compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data, flush):
+        data = self.compressor.process(data)
+        if flush:
+            data += self.compressor.flush()
+        return data
+
+    def finish(self):
+        return self.compressor.finish()
+
+
+class Encoding(object):
+
+    def __init__(self, name, level):
+        self.name = name
+        self.level = level
+
+    def compress(self, data):
+        if self.name == 'br':
+            return brotli.compress(data, quality=self.level)
+        return gzip.compress(data, compresslevel=self.level, mtime=0)
+
+    def stream(self):
+        if self.name == 'br':
+            return BrotliStream(self.level)
+        return GzipStream(self.level)
+
+
+def negotiate(encodings, accept_encodings):
+    best, best_quality = None, 0
+    for encoding in encodings:
+        quality = accept_encodings.quality(encoding.name)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compressed(chunks, source, stream, flush_size):
+    # Flushes the first chunk, then whenever flush_size bytes have gone in
+    # since the last flush.
+    pending, first = 0, True
+    try:
+        for chunk in chunks:
+            if not chunk:
+                continue
+            pending += len(chunk)
+            flush = first or pending >= flush_size
+            data = stream.compress(chunk, flush)
+            if flush:
+                pending, first = 0, False
+            if data:
+                yield data
+        yield stream.finish()
+    finally:
+        # Ends the app's iterable too (stream_with_context's request
+        # context, server-side cursors).
+        close = getattr(source, 'close', None)
+        if close is not None:
+            close()
+
+
+def init_app(app):
+    # In preference order.
+    encodings = [Encoding('gzip', app.config['COMPRESS_GZIP_LEVEL'])]
+    if brotli is not None:
+        encodings.insert(
+            0, Encoding('br', app.config['COMPRESS_BROTLI_QUALITY']))
+    mimetypes = frozenset(app.config['COMPRESS_MIMETYPES'])
+
+    # Registered after telemetry.init_app, so this runs before its hook,
+    # which then counts the compressed bytes.
+    @app.after_request
+    def compress_response(response):
+        if response.mimetype not in mimetypes:
+            return response
+        response.vary.add('Accept-Encoding')
+        if (response.direct_passthrough
+                or 'Content-Encoding' in response.headers
+                or response.status_code < 200
+                or response.status_code in (204, 206, 304)
+                or response.cache_control.no_transform):
+            return response
+        encoding = negotiate(encodings, request.accept_encodings)
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            source = response.response
+            response.response = compressed(
+                response.iter_encoded(), source, encoding.stream(),
+                app.config['COMPRESS_STREAM_FLUSH_SIZE'])
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < app.config['COMPRESS_MIN_SIZE']:
+                return response
+            response.set_data(encoding.compress(data))
+        response.headers['Content-Encoding'] = encoding.name
+        return response
@@ -0,0 +1,166 @@
+from collections import Counter
+from datetime import datetime
+
+import click
+from flask.cli import AppGroup
+from models import db, Venue, Artist, Show, UpcomingShowWatermark
+
+# Denormalised Venue/Artist.upcoming_show_count.
+#
+# A counter holds the number of the owner's shows that start after the
+# single UpcomingShowWatermark.refreshed_at timestamp. Creating or deleting
+# such a show adjusts the counters in the same flush (adjust_counters);
+# ``flask counters refresh``, run periodically (e.g. every minute from
+# cron), moves the watermark to now and subtracts the shows that started
+# in between; ``flask counters check`` compares every counter against a
+# live COUNT and can repair them.
+#
+# Writers hold the watermark row FOR SHARE and the refresh holds it FOR
+# UPDATE, so a show is never counted against two different watermarks.
+
+OWNERS = (
+    (Venue, Show.venue_id, 'venue_id'),
+    (Artist, Show.artist_id, 'artist_id'),
+)
+
+counters_cli = AppGroup('counters', help='Upcoming show counters.')
+
+
+def init_app(app):
+    db.event.listen(db.session, 'before_flush', adjust_counters)
+    app.cli.add_command(counters_cli)
+
+
+def read_watermark(connection, for_update=False):
+    table = UpcomingShowWatermark.__table__
+    query = db.select([table.c.id, table.c.refreshed_at])\
+        .with_for_update(read=not for_update)
+    row = connection.execute(query).first()
+    if row is not None:
+        return row
+    # Fresh database without the migration's seed row.
+    connection.execute(table.insert().values(refreshed_at=datetime.now()))
+    return connection.execute(query).first()
+
+
+def adjust_counters(session, flush_context, instances):
+    shows = [(show, 1) for show in session.new if isinstance(show, Show)]
+    shows += [(show, -1) for show in session.deleted
+              if isinstance(show, Show)]
+    if not shows:
+        return
+
+    connection = session.connection()
+    watermark = read_watermark(connection).refreshed_at
+    deltas = {model: Counter() for model, column, key in OWNERS}
+    for show, delta in shows:
+        if show.start_time > watermark:
+            for model, column, key in OWNERS:
+                deltas[model][getattr(show, key)] += delta
+
+    for model, changes in deltas.items():
+        # One UPDATE per model, not per owner: deleting a venue changes the
+        # counters of all its artists at once.
+        changes = {ident: delta for ident, delta in changes.items() if delta}
+        if not changes:
+            continue
+        table = model.__table__
+        connection.execute(
+            table.update()
+            .where(table.c.id.in_(list(changes)))
+            .values(upcoming_show_count=(
+                table.c.upcoming_show_count
+                + db.case(changes, value=table.c.id))))
+
+
+def refresh():
+    # Returns the number of shows that moved into the past.
+    connection = db.session.connection()
+    watermark = read_watermark(connection, for_update=True)
+    now = datetime.now()
+    window = db.and_(
+        Show.start_time > watermark.refreshed_at,
+        Show.start_time <= now)
+    for model, column, key in OWNERS:
+        table = model.__table__
+        passed = db.select([db.func.count()])\
+            .where(db.and_(column == table.c.id, window))\
+            .scalar_subquery()
+        connection.execute(
+            table.update()
+            .where(table.c.id.in_(db.select([column]).where(window)))
+            .values(upcoming_show_count=(
+                table.c.upcoming_show_count - passed)))
+    passed_total = connection.execute(
+        db.select([db.func.count()]).where(window)).scalar()
+    connection.execute(
+        UpcomingShowWatermark.__table__.update()
+        .where(UpcomingShowWatermark.id == watermark.id)
+        .values(refreshed_at=now))
+    db.session.commit()
+    return passed_total
+
+
+def recount(connection, model, ids):
+    # Recompute the counters of ``ids`` with a live COUNT. For writers that
+    # bypass the ORM (flask import), where adjust_counters does not run.
+    column = {owner: column for owner, column, key in OWNERS}[model]
+    watermark = read_watermark(connection).refreshed_at
+    table = model.__table__
+    live = db.select([db.func.count()])\
+        .where(db.and_(column == table.c.id, Show.start_time > watermark))\
+        .scalar_subquery()
+    connection.execute(
+        table.update()
+        .where(table.c.id.in_(ids))
+        .values(upcoming_show_count=live))
+
+
+def check(fix=False):
+    # Returns (model, id, counter, live) for every counter that disagrees
+    # with a live COUNT against the current watermark.
+    connection = db.session.connection()
+    watermark = read_watermark(connection).refreshed_at
+    mismatches = []
+    for model, column, key in OWNERS:
+        live = db.select([db.func.count()])\
+            .where(db.and_(column == model.id,
+                           Show.start_time > watermark))\
+            .scalar_subquery()
+        rows = db.session.query(
+            model.id, model.upcoming_show_count, live.label('live'))\
+            .filter(model.upcoming_show_count != live)\
+            .all()
+        for ident, counter, count in rows:
+            mismatches.append((model, ident, counter, count))
+            if fix:
+                connection.execute(
+                    model.__table__.update()
+                    .where(model.__table__.c.id == ident)
+                    .values(upcoming_show_count=count))
+    if fix:
+        db.session.commit()
+    else:
+        db.session.rollback()
+    return mismatches
+
+
+@counters_cli.command('refresh')
+def refresh_command():
+    """Move shows that have started out of the upcoming counters."""
+    passed = refresh()
+    click.echo(f'{passed} shows moved into the past.')
+
+
+@counters_cli.command('check')
+@click.option('--fix', is_flag=True, help='Overwrite wrong counters.')
+def check_command(fix):
+    """Compare upcoming counters with a live COUNT."""
+    mismatches = check(fix=fix)
+    for model, ident, counter, count in mismatches:
+        click.echo(f'{model.__tablename__} {ident}: '
+                   f'counter {counter}, live {count}')
+    click.echo(f'{len(mismatches)} mismatched counters'
+               + (' fixed.' if fix and mismatches else '.'))
+    if mismatches and not fix:
+        raise SystemExit(1)
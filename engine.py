@@ -0,0 +1,167 @@
+import threading
+import time
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError
+from sqlalchemy.pool import QueuePool
+
+# Engine and connection-pool settings.
+#
+# engine_options() turns the DB_* settings (config.py, overridable from the
+# environment or a FYYUR_SETTINGS file) into create_engine() arguments.
+# DB_PROFILE picks one of two setups:
+#
+# 'direct'     workers connect to Postgres themselves. Each process keeps
+#              up to DB_POOL_SIZE + DB_MAX_OVERFLOW connections, so
+#              workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) must stay below
+#              max_connections. statement_timeout is a startup option.
+# 'pgbouncer'  workers connect to PgBouncer in transaction mode (see
+#              docker-compose.yml). It rejects startup options and drops
+#              session settings between transactions, so statement_timeout
+#              is sent with SET LOCAL at the start of every transaction.
+#              Set DB_STATEMENT_TIMEOUT = 0 and use ALTER ROLE ... SET
+#              statement_timeout instead to save that round trip.
+#
+# Pool options only apply to PostgreSQL URLs; other databases keep
+# Flask-SQLAlchemy's defaults.
+
+PROFILES = ('direct', 'pgbouncer')
+
+
+class PoolStats(object):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record(self, wait, timed_out):
+        with self.lock:
+            self.checkouts += 1
+            self.timeouts += timed_out
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+
+
+# Keyed by pool logging name, so the figures survive the pool being
+# recreated after a disconnect.
+_pool_stats = {}
+
+
+class TimedQueuePool(QueuePool):
+    # QueuePool that records how long each checkout took, including the
+    # time spent waiting for a free slot or opening a new connection.
+
+    def __init__(self, creator, max_overflow=10, **kwargs):
+        super().__init__(creator, max_overflow=max_overflow, **kwargs)
+        # QueuePool keeps its own copy private.
+        self.max_overflow = max_overflow
+        self.stats = _pool_stats.setdefault(self.logging_name, PoolStats())
+
+    def connect(self):
+        start = time.perf_counter()
+        timed_out = False
+        try:
+            return super().connect()
+        except TimeoutError:
+            timed_out = True
+            raise
+        finally:
+            self.stats.record(time.perf_counter() - start, timed_out)
+
+
+def engine_options(config, name='primary'):
+    profile = config['DB_PROFILE']
+    if profile not in PROFILES:
+        raise RuntimeError(
+            f'DB_PROFILE must be one of {", ".join(PROFILES)}, '
+            f'not {profile!r}')
+    if not config['SQLALCHEMY_DATABASE_URI'].startswith('postgres'):
+        return {}
+
+    options = {
+        'poolclass': TimedQueuePool,
+        'pool_logging_name': name,
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+    }
+    timeout = config['DB_STATEMENT_TIMEOUT']
+    if timeout and profile == 'direct':
+        options['connect_args'] = {
+            'options': f'-c statement_timeout={int(timeout)}'}
+    return options
+
+
+def async_url(url, config):
+    # postgresql:// URL -> the asyncpg driver used by asgi.py.
+    scheme, rest = url.split('://', 1)
+    if not scheme.startswith('postgres'):
+        raise RuntimeError(
+            f'The async read path needs PostgreSQL, not {scheme}')
+    url = 'postgresql+asyncpg://' + rest
+    if config['DB_PROFILE'] == 'pgbouncer':
+        # Transaction pooling cannot keep named prepared statements.
+        url += '&' if '?' in url else '?'
+        url += 'prepared_statement_cache_size=0'
+    return url
+
+
+def async_engine_options(config):
+    # create_async_engine() arguments. Sized separately from the sync pool:
+    # each async detail page holds several connections at once.
+    options = {
+        'pool_size': config['ASYNC_DB_POOL_SIZE'],
+        'max_overflow': config['ASYNC_DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+    }
+    timeout = config['DB_STATEMENT_TIMEOUT']
+    if config['DB_PROFILE'] == 'pgbouncer':
+        options['connect_args'] = {'statement_cache_size': 0}
+    elif timeout:
+        options['connect_args'] = {
+            'server_settings': {'statement_timeout': str(int(timeout))}}
+    return options
+
+
+def init_engine(engine, config):
+    # Per-transaction settings that engine_options() cannot express.
+    timeout = config['DB_STATEMENT_TIMEOUT']
+    if (timeout and config['DB_PROFILE'] == 'pgbouncer'
+            and engine.dialect.name == 'postgresql'):
+        statement = f'SET LOCAL statement_timeout = {int(timeout)}'
+
+        @event.listens_for(engine, 'begin')
+        def set_statement_timeout(connection):
+            # Marked so query budgets do not count it (see budgets.py).
+            connection.exec_driver_sql(
+                statement, execution_options={'connection_setup': True})
+
+
+def pool_stats(engine):
+    """Live occupancy and cumulative checkout figures for ``engine``'s pool.
+
+    Pools other than TimedQueuePool (SQLite, tests) report only their
+    status string.
+    """
+    pool = engine.pool
+    if not isinstance(pool, TimedQueuePool):
+        return {'status': pool.status()}
+    stats = pool.stats
+    with stats.lock:
+        return {
+            'pool_size': pool.size(),
+            'max_overflow': pool.max_overflow,
+            'checked_out': pool.checkedout(),
+            'idle': pool.checkedin(),
+            'overflow': max(pool.overflow(), 0),
+            'checkouts': stats.checkouts,
+            'timeouts': stats.timeouts,
+            'wait_seconds_total': stats.wait_total,
+            'wait_seconds_max': stats.wait_max,
+        }
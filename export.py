@@ -0,0 +1,111 @@
+import json
+from collections import namedtuple
+from datetime import datetime
+from itertools import islice
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from models import (
+    db,
+    Venue,
+    Artist,
+    Show,
+    venue_genres,
+    artist_genres,
+    load_genre_names
+)
+
+# Newline-delimited JSON dumps of venues, artists and shows, shared by the
+# /export/<kind> endpoints and ``flask export``.
+#
+# Rows come from a server-side cursor in STREAM_BATCH_SIZE batches ordered
+# by (created_date, id); genre names are fetched once per batch. Memory
+# stays flat however large the table, and output starts with the first
+# batch. ``since`` keeps rows with created_date >= since; a consumer can
+# pass the largest created_date it has seen and drop repeated ids.
+
+Export = namedtuple('Export', 'model columns genre_owner')
+
+EXPORTS = {
+    'venues': Export(
+        Venue,
+        ['id', 'name', 'city', 'state', 'address', 'phone', 'image_link',
+         'facebook_link', 'website_link', 'seeking_talent',
+         'seeking_description', 'created_date', 'updated_at'],
+        venue_genres.c.venue_id),
+    'artists': Export(
+        Artist,
+        ['id', 'name', 'city', 'state', 'phone', 'image_link',
+         'facebook_link', 'website_link', 'seeking_venue',
+         'seeking_description', 'created_date', 'updated_at'],
+        artist_genres.c.artist_id),
+    'shows': Export(
+        Show,
+        ['id', 'venue_id', 'artist_id', 'start_time', 'created_date',
+         'updated_at'],
+        None),
+}
+
+
+def init_app(app):
+    app.cli.add_command(export_command)
+
+
+def parse_since(value):
+    # ISO 8601 date or datetime; raises ValueError.
+    return datetime.fromisoformat(value) if value else None
+
+
+def export_rows(kind, since=None):
+    export = EXPORTS[kind]
+    model = export.model
+    batch_size = current_app.config['STREAM_BATCH_SIZE']
+    query = db.session.query(
+        *[getattr(model, column) for column in export.columns])\
+        .order_by(model.created_date, model.id)
+    if since is not None:
+        query = query.filter(model.created_date >= since)
+    rows = iter(query
+                .execution_options(stream_results=True)
+                .yield_per(batch_size))
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return
+        if export.genre_owner is not None:
+            genres = load_genre_names(
+                export.genre_owner, [row.id for row in batch])
+        for row in batch:
+            item = dict(zip(export.columns, row))
+            if export.genre_owner is not None:
+                item['genres'] = genres[row.id]
+            yield item
+
+
+def json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def ndjson(rows):
+    for row in rows:
+        yield json.dumps(row, default=json_default) + '\n'
+
+
+@click.command('export')
+@click.argument('kind', type=click.Choice(sorted(EXPORTS)))
+@click.option('--since', help='Only rows created at or after this ISO date.')
+@click.option('--output', type=click.File('w'), default='-',
+              help='Output file. Default: stdout.')
+@with_appcontext
+def export_command(kind, since, output):
+    """Write venues, artists or shows as newline-delimited JSON."""
+    try:
+        since = parse_since(since)
+    except ValueError:
+        raise click.BadParameter(since, param_hint='--since')
+    for line in ndjson(export_rows(kind, since)):
+        output.write(line)
@@ -4,15 +4,22 @@ from fabric.contrib.console import confirm
 # prepare for deployment
 
 
+# Smoke test: every read route, within its query budget (see bench.py).
+BENCH_CHECK = "FLASK_APP=app.py flask bench routes --requests 3 --check"
+
+
 def test():
     with settings(warn_only=True):
-        result = local(
-            "python test_tasks.py -v && python test_users.py -v", capture=True
-        )
+        result = local(BENCH_CHECK + " > /dev/null", capture=True)
     if result.failed and not confirm("Tests failed. Continue?"):
         abort("Aborted at user request.")
 
 
+def build_assets():
+    # Fingerprinted, compressed copies of static/ (see assets.py).
+    local("FLASK_APP=app.py flask assets build")
+
+
 def commit():
     message = raw_input("Enter a git commit message: ")
     local("git add . && git commit -am '{}'".format(message))
@@ -24,6 +31,7 @@ def push():
 
 def prepare():
     test()
+    build_assets()
     commit()
     push()
 
@@ -39,14 +47,13 @@ def heroku():
 
 
 def heroku_test():
-    local(
-        "heroku run python test_tasks.py -v && heroku run python test_users.py -v"
-    )
+    local('heroku run "{} > /dev/null"'.format(BENCH_CHECK))
 
 
 def deploy():
     pull()
     test()
+    build_assets()
     commit()
     heroku()
     heroku_test()
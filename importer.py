@@ -0,0 +1,382 @@
+import csv
+import io
+import json
+import os
+import time
+from collections import namedtuple
+from datetime import datetime
+
+import click
+from flask.cli import with_appcontext
+from werkzeug.datastructures import MultiDict
+
+import counters
+from cache import cache
+from forms import VenueForm, ArtistForm, ShowForm
+from models import db, Venue, Artist, Show
+
+# Bulk loader: ``flask import venues|artists|shows FILE --source NAME``.
+#
+# Rows are read from CSV or NDJSON in batches and validated with the same
+# forms as the create pages. Valid rows are COPYed into a temporary staging
+# table and upserted on import_key = "<source>:<external_id>", so loading a
+# file again updates the rows it created instead of duplicating them. Show
+# rows name their venue and artist by the external ids of the same source.
+#
+# After every committed batch the number of rows consumed goes to a
+# checkpoint file next to the input; --resume continues from there.
+# Rejected rows (failed validation, unknown venue or artist) can be written
+# with their errors to a --rejects NDJSON file.
+#
+# The staging table lives for one transaction (ON COMMIT DROP), so this also
+# works through PgBouncer in transaction mode.
+
+Kind = namedtuple('Kind', 'model form fields booleans link owner_id')
+
+KINDS = {
+    'venues': Kind(
+        Venue, VenueForm,
+        ['name', 'city', 'state', 'address', 'phone', 'image_link',
+         'facebook_link', 'website_link', 'seeking_talent',
+         'seeking_description'],
+        ['seeking_talent'],
+        'VenueGenre', 'venue_id'),
+    'artists': Kind(
+        Artist, ArtistForm,
+        ['name', 'city', 'state', 'phone', 'image_link', 'facebook_link',
+         'website_link', 'seeking_venue', 'seeking_description'],
+        ['seeking_venue'],
+        'ArtistGenre', 'artist_id'),
+    'shows': Kind(
+        Show, ShowForm,
+        ['venue_key', 'artist_key', 'start_time'],
+        [],
+        None, None),
+}
+
+FALSE_VALUES = ('', '0', 'f', 'false', 'n', 'no', 'off')
+
+STAGING_TABLE = """
+CREATE TEMPORARY TABLE import_staging (
+    seq integer NOT NULL,
+    import_key text NOT NULL,
+    {columns}
+) ON COMMIT DROP
+"""
+
+# Keep only the last occurrence of a key: ON CONFLICT cannot touch the same
+# row twice in one statement.
+DEDUPLICATE = """
+DELETE FROM import_staging a USING import_staging b
+WHERE a.import_key = b.import_key AND a.seq < b.seq
+"""
+
+UPSERT_OWNERS = """
+INSERT INTO "{table}" (import_key, {columns}, created_date, updated_at)
+SELECT import_key, {columns}, %(now)s, %(now)s FROM import_staging
+ON CONFLICT (import_key) DO UPDATE SET {updates},
+    updated_at = EXCLUDED.updated_at
+RETURNING id
+"""
+
+# Genre links are diffed rather than replaced, so unchanged links do not
+# fire the link triggers (genre counters, search_vector).
+DELETE_LINKS = """
+DELETE FROM "{link}" l USING "{table}" o, import_staging s
+WHERE l.{owner_id} = o.id AND o.import_key = s.import_key
+AND l.genre_id NOT IN (
+    SELECT g.id FROM json_array_elements_text(s.genres::json) AS e(name)
+    JOIN "Genre" g ON g.name = e.name)
+"""
+
+INSERT_LINKS = """
+INSERT INTO "{link}" ({owner_id}, genre_id)
+SELECT o.id, g.id
+FROM import_staging s JOIN "{table}" o ON o.import_key = s.import_key,
+     json_array_elements_text(s.genres::json) AS e(name)
+     JOIN "Genre" g ON g.name = e.name
+ON CONFLICT DO NOTHING
+"""
+
+UNRESOLVED_SHOWS = """
+DELETE FROM import_staging s
+WHERE NOT EXISTS (SELECT 1 FROM "Venue" v WHERE v.import_key = s.venue_key)
+OR NOT EXISTS (SELECT 1 FROM "Artist" a WHERE a.import_key = s.artist_key)
+RETURNING s.seq,
+    EXISTS (SELECT 1 FROM "Venue" v WHERE v.import_key = s.venue_key),
+    EXISTS (SELECT 1 FROM "Artist" a WHERE a.import_key = s.artist_key)
+"""
+
+# Owners whose counters the upsert may change: the current ones of shows
+# about to be updated, then the new ones returned by UPSERT_SHOWS.
+SHOW_OWNERS = """
+SELECT sh.venue_id, sh.artist_id
+FROM "Show" sh JOIN import_staging s ON s.import_key = sh.import_key
+"""
+
+UPSERT_SHOWS = """
+INSERT INTO "Show" (
+    import_key, venue_id, artist_id, start_time, created_date, updated_at)
+SELECT s.import_key, v.id, a.id, s.start_time, %(now)s, %(now)s
+FROM import_staging s
+JOIN "Venue" v ON v.import_key = s.venue_key
+JOIN "Artist" a ON a.import_key = s.artist_key
+ON CONFLICT (import_key) DO UPDATE SET
+    venue_id = EXCLUDED.venue_id,
+    artist_id = EXCLUDED.artist_id,
+    start_time = EXCLUDED.start_time,
+    updated_at = EXCLUDED.updated_at
+RETURNING venue_id, artist_id
+"""
+
+
+def init_app(app):
+    app.cli.add_command(import_command)
+
+
+def read_rows(path, file_format):
+    # Yields (row number, dict) pairs; row numbers start at 1 and do not
+    # count the CSV header.
+    with open(path, newline='', encoding='utf-8') as f:
+        if file_format == 'csv':
+            yield from enumerate(csv.DictReader(f), 1)
+            return
+        number = 0
+        for line in f:
+            if line.strip():
+                number += 1
+                yield number, json.loads(line)
+
+
+def to_formdata(kind, row):
+    data = MultiDict()
+    for key, value in row.items():
+        if key == 'genres':
+            if isinstance(value, str):
+                value = [name.strip() for name in value.split(',')]
+            data.setlist(key, [name for name in value or [] if name])
+        elif key in kind.booleans:
+            data[key] = 'y' if str(value).lower() not in FALSE_VALUES else ''
+        elif value is not None:
+            data[key] = str(value)
+    return data
+
+
+def validate(kind, source, row):
+    # Returns (import_key, form, errors).
+    form = kind.form(formdata=to_formdata(kind, row), meta={'csrf': False})
+    errors = {} if form.validate() else dict(form.errors)
+    required = ['external_id']
+    if kind.model is Show:
+        # A missing start_time would fall back to the form's default.
+        required += ['venue_id', 'artist_id', 'start_time']
+    for name in required:
+        if not str(row.get(name) or '').strip():
+            errors[name] = ['This field is required.']
+    key = f"{source}:{str(row.get('external_id') or '').strip()}"
+    return key, form, errors
+
+
+def staging_values(kind, source, number, key, form):
+    if kind.model is Show:
+        return [number, key,
+                f'{source}:{form.venue_id.data.strip()}',
+                f'{source}:{form.artist_id.data.strip()}',
+                form.start_time.data]
+    return ([number, key]
+            + [form[name].data for name in kind.fields]
+            + [json.dumps(form.genres.data)])
+
+
+def staging_columns(kind):
+    if kind.model is Show:
+        return ['venue_key text', 'artist_key text', 'start_time timestamp']
+    return ([f'{name} boolean' if name in kind.booleans else f'{name} text'
+             for name in kind.fields]
+            + ['genres text'])
+
+
+def copy_rows(cursor, rows):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    cursor.copy_expert(
+        'COPY import_staging FROM STDIN WITH (FORMAT csv)', buffer)
+
+
+def load_owners(cursor, kind, now):
+    # Returns the ids of the inserted or updated rows.
+    table = kind.model.__tablename__
+    columns = ', '.join(kind.fields)
+    updates = ', '.join(f'{name} = EXCLUDED.{name}' for name in kind.fields)
+    cursor.execute(UPSERT_OWNERS.format(
+        table=table, columns=columns, updates=updates), {'now': now})
+    ids = [row[0] for row in cursor.fetchall()]
+    names = dict(table=table, link=kind.link, owner_id=kind.owner_id)
+    cursor.execute(DELETE_LINKS.format(**names))
+    cursor.execute(INSERT_LINKS.format(**names))
+    return ids
+
+
+def load_shows(cursor, now):
+    # Returns (venue ids, artist ids, unresolved rows, loaded) where
+    # unresolved rows are (row number, errors) for shows with an unknown
+    # venue or artist and loaded is the number of shows upserted.
+    cursor.execute(UNRESOLVED_SHOWS)
+    unresolved = []
+    for number, venue_found, artist_found in cursor.fetchall():
+        errors = {}
+        if not venue_found:
+            errors['venue_id'] = ['Unknown venue.']
+        if not artist_found:
+            errors['artist_id'] = ['Unknown artist.']
+        unresolved.append((number, errors))
+    cursor.execute(SHOW_OWNERS)
+    owners = cursor.fetchall()
+    cursor.execute(UPSERT_SHOWS, {'now': now})
+    upserted = cursor.fetchall()
+    owners += upserted
+    return ({venue for venue, artist in owners},
+            {artist for venue, artist in owners},
+            unresolved,
+            len(upserted))
+
+
+def load_batch(connection, kind, source, batch):
+    # Loads ``batch`` of (row number, import_key, form, row) in one
+    # transaction. Returns (loaded, rejected) where loaded is the number of
+    # rows the upsert inserted or updated (a key repeated in the batch once)
+    # and rejected holds (row number, errors, row) for rows the database
+    # refused.
+    by_number = {number: row for number, key, form, row in batch}
+    now = datetime.utcnow()
+    rejected = []
+    with connection.begin():
+        connection.exec_driver_sql(STAGING_TABLE.format(
+            columns=',\n    '.join(staging_columns(kind))))
+        cursor = connection.connection.cursor()
+        copy_rows(cursor, [
+            staging_values(kind, source, number, key, form)
+            for number, key, form, row in batch])
+        cursor.execute(DEDUPLICATE)
+        if kind.model is Show:
+            venue_ids, artist_ids, unresolved, loaded = load_shows(
+                cursor, now)
+            rejected = [(number, errors, by_number[number])
+                        for number, errors in unresolved]
+            if venue_ids:
+                counters.recount(connection, Venue, list(venue_ids))
+            if artist_ids:
+                counters.recount(connection, Artist, list(artist_ids))
+        else:
+            ids = load_owners(cursor, kind, now)
+            loaded = len(ids)
+    if kind.model is not Show:
+        namespace = kind.model.__tablename__.lower()
+        for ident in ids:
+            cache.bump(namespace, ident)
+    return loaded, rejected
+
+
+def read_checkpoint(path, kind_name, source):
+    try:
+        with open(path) as f:
+            checkpoint = json.load(f)
+    except FileNotFoundError:
+        return 0
+    if (checkpoint['kind'], checkpoint['source']) != (kind_name, source):
+        raise click.UsageError(
+            f'{path} belongs to a {checkpoint["kind"]} import from '
+            f'{checkpoint["source"]!r}')
+    return checkpoint['rows']
+
+
+def write_checkpoint(path, kind_name, source, rows):
+    with open(path + '.tmp', 'w') as f:
+        json.dump({'kind': kind_name, 'source': source, 'rows': rows}, f)
+    os.replace(path + '.tmp', path)
+
+
+@click.command('import')
+@click.argument('kind_name', metavar='KIND', type=click.Choice(sorted(KINDS)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--source', required=True,
+              help='Partner name; prefixes every external_id.')
+@click.option('--format', 'file_format', type=click.Choice(['csv', 'ndjson']),
+              help='Input format. Default: from the file extension.')
+@click.option('--batch-size', default=5000, show_default=True,
+              help='Rows per COPY and transaction.')
+@click.option('--resume', is_flag=True,
+              help='Skip the rows committed by an interrupted run.')
+@click.option('--rejects', type=click.Path(dir_okay=False),
+              help='Write rejected rows and their errors here as NDJSON.')
+@with_appcontext
+def import_command(kind_name, path, source, file_format, batch_size, resume,
+                   rejects):
+    """Bulk load venues, artists or shows from a CSV or NDJSON file."""
+    if db.engine.dialect.name != 'postgresql':
+        raise click.UsageError('flask import needs PostgreSQL (COPY).')
+    kind = KINDS[kind_name]
+    file_format = file_format or (
+        'csv' if path.lower().endswith('.csv') else 'ndjson')
+    checkpoint = path + '.checkpoint'
+    skip = read_checkpoint(checkpoint, kind_name, source) if resume else 0
+    if skip:
+        click.echo(f'Resuming after row {skip}.', err=True)
+    reject_file = open(rejects, 'a' if resume else 'w') if rejects else None
+
+    rows = loaded = rejected = 0
+    started = time.perf_counter()
+    connection = db.engine.connect()
+    try:
+        batch = []
+        # Rejects are written with their batch, so a resumed run does not
+        # repeat them.
+        pending_rejects = []
+        last = skip
+
+        def flush():
+            nonlocal loaded, rejected, batch, pending_rejects
+            if batch:
+                batch_loaded, batch_rejected = load_batch(
+                    connection, kind, source, batch)
+                loaded += batch_loaded
+                pending_rejects += batch_rejected
+            rejected += len(pending_rejects)
+            if reject_file:
+                for number, errors, row in pending_rejects:
+                    reject_file.write(json.dumps(
+                        {'row': number, 'errors': errors, 'data': row},
+                        default=str) + '\n')
+                reject_file.flush()
+            batch = []
+            pending_rejects = []
+            write_checkpoint(checkpoint, kind_name, source, last)
+            elapsed = time.perf_counter() - started
+            click.echo(
+                f'{last} rows read, {loaded} loaded, {rejected} rejected '
+                f'({rows / elapsed:.0f} rows/s)', err=True)
+
+        for number, row in read_rows(path, file_format):
+            if number <= skip:
+                continue
+            rows += 1
+            last = number
+            key, form, errors = validate(kind, source, row)
+            if errors:
+                pending_rejects.append((number, errors, row))
+            else:
+                batch.append((number, key, form, row))
+            if rows % batch_size == 0:
+                flush()
+        flush()
+    finally:
+        connection.close()
+        if reject_file:
+            reject_file.close()
+
+    os.remove(checkpoint)
+    elapsed = time.perf_counter() - started
+    click.echo(
+        f'Done: {rows} rows in {elapsed:.1f}s ({rows / elapsed:.0f} rows/s), '
+        f'{loaded} loaded, {rejected} rejected.')
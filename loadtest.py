@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+"""Closed-loop HTTP load test for comparing the WSGI and ASGI deployments.
+
+Each of ``--concurrency`` clients keeps one HTTP/1.1 connection open and
+sends GETs back to back for ``--duration`` seconds, picking a random id from
+``--ids`` for the ``{id}`` in each URL template. Prints one JSON object per
+URL with the request count, errors, throughput and latency percentiles.
+
+Run both servers against the same database and compare at equal
+concurrency, e.g.:
+
+    gunicorn -w 4 -b :8000 app:app
+    uvicorn --workers 4 --port 8001 asgi:application
+
+    python loadtest.py http://127.0.0.1:8000/venues/{id} --ids 1-5000
+    python loadtest.py http://127.0.0.1:8001/venues/{id} --ids 1-5000
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from urllib.parse import urlsplit
+
+
+class Client(object):
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = self.writer = None
+
+    async def get(self, path):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(
+                self.host, self.port)
+        self.writer.write(
+            f'GET {path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n'
+            f'Accept-Encoding: identity\r\n\r\n'.encode('latin-1'))
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError('connection closed')
+        status = int(status_line.split()[1])
+        length, chunked, close = None, False, False
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            name, value = name.strip().lower(), value.strip().lower()
+            if name == 'content-length':
+                length = int(value)
+            elif name == 'transfer-encoding':
+                chunked = 'chunked' in value
+            elif name == 'connection':
+                close = value == 'close'
+        if chunked:
+            while True:
+                size = int((await self.reader.readline()).split(b';')[0], 16)
+                await self.reader.readexactly(size + 2)
+                if size == 0:
+                    break
+        elif length is not None:
+            await self.reader.readexactly(length)
+        else:
+            await self.reader.read()
+            close = True
+        if close:
+            self.close()
+        return status
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+def parse_ids(value):
+    first, _, last = value.partition('-')
+    return int(first), int(last or first)
+
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return round(ordered[index] * 1000, 2)
+
+
+async def worker(url, ids, deadline, latencies, errors, measure_from):
+    parts = urlsplit(url)
+    client = Client(parts.hostname, parts.port or 80)
+    path_template = parts.path + ('?' + parts.query if parts.query else '')
+    try:
+        while time.perf_counter() < deadline:
+            path = path_template.replace('{id}', str(random.randint(*ids)))
+            start = time.perf_counter()
+            try:
+                status = await client.get(path)
+                ok = status < 400
+            except (OSError, ValueError, asyncio.IncompleteReadError):
+                client.close()
+                ok = False
+            end = time.perf_counter()
+            if start < measure_from:
+                continue
+            if ok:
+                latencies.append(end - start)
+            else:
+                errors.append(end - start)
+    finally:
+        client.close()
+
+
+async def run(url, ids, concurrency, duration, warmup):
+    latencies, errors = [], []
+    start = time.perf_counter()
+    measure_from = start + warmup
+    deadline = measure_from + duration
+    await asyncio.gather(*[
+        worker(url, ids, deadline, latencies, errors, measure_from)
+        for _ in range(concurrency)])
+    elapsed = time.perf_counter() - measure_from
+    latencies.sort()
+    return {
+        'url': url,
+        'concurrency': concurrency,
+        'duration': round(elapsed, 2),
+        'requests': len(latencies),
+        'errors': len(errors),
+        'rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': percentile(latencies, 0.50),
+        'p90_ms': percentile(latencies, 0.90),
+        'p99_ms': percentile(latencies, 0.99),
+        'max_ms': percentile(latencies, 1.0),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.split('\n\n')[0])
+    parser.add_argument('urls', nargs='+', metavar='URL',
+                        help='URL template; {id} is replaced per request')
+    parser.add_argument('--ids', type=parse_ids, default=(1, 1),
+                        help='id range for {id}, e.g. 1-5000')
+    parser.add_argument('-c', '--concurrency', type=int, default=32)
+    parser.add_argument('-d', '--duration', type=float, default=30,
+                        help='seconds measured per URL')
+    parser.add_argument('--warmup', type=float, default=3,
+                        help='seconds run before measuring')
+    args = parser.parse_args()
+    for url in args.urls:
+        print(json.dumps(asyncio.run(run(
+            url, args.ids, args.concurrency, args.duration, args.warmup))),
+            flush=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,280 @@
+import atexit
+import fcntl
+import json
+import logging
+import os
+import queue
+import re
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from uuid import uuid4
+
+from flask import g, has_request_context, request
+from flask.logging import default_handler
+
+# Structured, non-blocking logging.
+#
+# Records logged on app.logger are formatted as one JSON object per line on
+# the thread that logs them, then handed to a bounded queue; a listener
+# thread writes them to LOG_FILE. Request threads never wait on disk I/O.
+# Under load the listener drains what has queued up, up to LOG_BATCH_SIZE
+# records, and writes the batch with a single write() to a file opened with
+# O_APPEND, so lines from several worker processes never interleave. When
+# the file would grow past LOG_MAX_BYTES it is rotated to LOG_FILE.1 ..
+# LOG_FILE.<LOG_BACKUP_COUNT>; workers that find the file rotated under
+# them reopen it instead of rotating again. If the queue is full (the disk
+# cannot keep up), records are dropped and counted, and the count is logged
+# once there is room again.
+#
+# Records logged during a request carry its id (the X-Request-ID header if
+# the client sent a usable one, else a new one, echoed in the response),
+# route, method and path, and the milliseconds since the request started.
+# Fields passed with ``extra`` are included as they are.
+#
+# In debug mode records go to Flask's default stderr handler instead.
+
+REQUEST_ID = re.compile(r'^[A-Za-z0-9._:-]{1,64}$')
+
+# Attributes every LogRecord has; anything else came from ``extra``.
+RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {
+    'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc)
+            .isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'pid': record.process,
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        if record.stack_info:
+            entry['stack'] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str)
+
+
+def add_request_context(record):
+    if not has_request_context():
+        return
+    start = g.get('request_start')
+    context = {
+        'request_id': g.get('request_id'),
+        'route': request.url_rule.rule if request.url_rule else None,
+        'method': request.method,
+        'path': request.full_path.rstrip('?'),
+        'duration_ms': None if start is None else
+        round((time.perf_counter() - start) * 1000, 1),
+    }
+    for key, value in context.items():
+        if not hasattr(record, key):
+            setattr(record, key, value)
+
+
+class BatchFileHandler(logging.Handler):
+    # Appends batches of formatted records to a size-rotated file.
+
+    def __init__(self, filename, max_bytes, backup_count):
+        super().__init__()
+        self.filename = os.path.abspath(filename)
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.fd = None
+        self.inode = None
+
+    def open(self):
+        self.fd = os.open(
+            self.filename, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self.inode = os.fstat(self.fd).st_ino
+
+    def close_file(self):
+        if self.fd is not None:
+            os.close(self.fd)
+        self.fd = None
+
+    def moved(self):
+        # Another worker rotated the file.
+        try:
+            return os.stat(self.filename).st_ino != self.inode
+        except FileNotFoundError:
+            return True
+
+    def rotate(self):
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        try:
+            if not self.moved():
+                for number in range(self.backup_count - 1, 0, -1):
+                    source = f'{self.filename}.{number}'
+                    if os.path.exists(source):
+                        os.replace(source, f'{self.filename}.{number + 1}')
+                if self.backup_count:
+                    os.replace(self.filename, self.filename + '.1')
+                else:
+                    os.remove(self.filename)
+        finally:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+        self.close_file()
+        self.open()
+
+    def emit(self, record):
+        self.write([record])
+
+    def write(self, records):
+        lines = []
+        for record in records:
+            try:
+                lines.append(self.format(record) + '\n')
+            except Exception:
+                self.handleError(record)
+        if not lines:
+            return
+        data = ''.join(lines).encode('utf-8')
+        with self.lock:
+            try:
+                if self.fd is None or self.moved():
+                    self.close_file()
+                    self.open()
+                if self.max_bytes:
+                    size = os.fstat(self.fd).st_size
+                    if size and size + len(data) > self.max_bytes:
+                        self.rotate()
+                while data:
+                    data = data[os.write(self.fd, data):]
+            except Exception:
+                self.handleError(records[-1])
+
+    def close(self):
+        with self.lock:
+            self.close_file()
+        super().close()
+
+
+class BatchListener(QueueListener):
+    # Hands the handler everything queued so far, up to batch_size records.
+
+    def __init__(self, queue, handler, batch_size):
+        super().__init__(queue, handler)
+        self.batch_size = batch_size
+        self.stopping = False
+
+    def dequeue(self, block):
+        if self.stopping:
+            return self._sentinel
+        record = self.queue.get(block)
+        if record is self._sentinel:
+            return record
+        batch = [record]
+        while len(batch) < self.batch_size:
+            try:
+                record = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if record is self._sentinel:
+                self.stopping = True
+                break
+            batch.append(record)
+        return batch
+
+    def handle(self, batch):
+        handler = self.handlers[0]
+        handler.write([
+            record for record in batch
+            if record.levelno >= handler.level and handler.filter(record)])
+
+    def enqueue_sentinel(self):
+        # Wait for room rather than lose the records before it.
+        self.queue.put(self._sentinel)
+
+
+class JsonQueueHandler(QueueHandler):
+    # Formats on the logging thread and queues the line for the listener;
+    # starts a listener in each process it is used in (workers forked after
+    # the app was imported included).
+
+    def __init__(self, target, queue_size, batch_size):
+        super().__init__(None)
+        self.target = target
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.setFormatter(JsonFormatter())
+        self.listener = None
+        self.pid = None
+        self.dropped = 0
+
+    def start(self):
+        self.queue = queue.Queue(self.queue_size)
+        self.listener = BatchListener(
+            self.queue, self.target, self.batch_size)
+        self.listener.start()
+        self.pid = os.getpid()
+
+    def stop(self):
+        if self.listener is not None and self.pid == os.getpid():
+            self.listener.stop()
+        self.listener = None
+        self.target.close()
+
+    def prepare(self, record):
+        add_request_context(record)
+        return super().prepare(record)
+
+    def emit(self, record):
+        if self.pid != os.getpid():
+            self.start()
+        super().emit(record)
+
+    def enqueue(self, record):
+        # Runs under the handler's lock.
+        try:
+            if self.dropped:
+                self.queue.put_nowait(self.prepare(logging.makeLogRecord({
+                    'name': record.name,
+                    'levelno': logging.WARNING,
+                    'levelname': 'WARNING',
+                    'msg': '%d log records dropped: the log queue was full',
+                    'args': (self.dropped,),
+                    'dropped': self.dropped,
+                })))
+                self.dropped = 0
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def init_app(app):
+    @app.before_request
+    def start_request():
+        g.request_start = time.perf_counter()
+        request_id = request.headers.get('X-Request-ID', '')
+        g.request_id = (request_id if REQUEST_ID.match(request_id)
+                        else uuid4().hex)
+
+    @app.after_request
+    def add_request_id(response):
+        if 'request_id' in g:
+            response.headers['X-Request-ID'] = g.request_id
+        return response
+
+    if app.debug or not app.config['LOG_FILE']:
+        return
+    target = BatchFileHandler(
+        app.config['LOG_FILE'], app.config['LOG_MAX_BYTES'],
+        app.config['LOG_BACKUP_COUNT'])
+    # Lines arrive formatted.
+    target.setFormatter(logging.Formatter('%(message)s'))
+    handler = JsonQueueHandler(
+        target, app.config['LOG_QUEUE_SIZE'], app.config['LOG_BATCH_SIZE'])
+    app.logger.removeHandler(default_handler)
+    app.logger.addHandler(handler)
+    app.logger.setLevel(app.config['LOG_LEVEL'])
+    atexit.register(handler.stop)
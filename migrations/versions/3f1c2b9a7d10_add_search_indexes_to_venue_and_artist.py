@@ -0,0 +1,49 @@
+"""add search indexes to venue and artist tables
+
+Revision ID: 3f1c2b9a7d10
+Revises: d874e62da5d4
+Create Date: 2026-10-17 09:12:41.530218
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c2b9a7d10'
+down_revision = 'd874e62da5d4'
+branch_labels = None
+depends_on = None
+
+# Same expression as models.SEARCH_VECTOR_SQL at the time of this revision.
+SEARCH_VECTOR_SQL = (
+    "setweight(to_tsvector('simple', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('simple', "
+    "coalesce(city, '') || ' ' || coalesce(state, '')), 'B') || "
+    "setweight(to_tsvector('simple', coalesce(genres, '')), 'C')"
+)
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+
+    for table in ('Venue', 'Artist'):
+        op.add_column(table, sa.Column(
+            'search_vector',
+            postgresql.TSVECTOR(),
+            sa.Computed(SEARCH_VECTOR_SQL, persisted=True)))
+        op.create_index(
+            f'ix_{table}_search_vector', table, ['search_vector'],
+            postgresql_using='gin')
+        op.create_index(
+            f'ix_{table}_name_trgm', table, ['name'],
+            postgresql_using='gin',
+            postgresql_ops={'name': 'gin_trgm_ops'})
+
+
+def downgrade():
+    for table in ('Artist', 'Venue'):
+        op.drop_index(f'ix_{table}_name_trgm', table_name=table)
+        op.drop_index(f'ix_{table}_search_vector', table_name=table)
+        op.drop_column(table, 'search_vector')
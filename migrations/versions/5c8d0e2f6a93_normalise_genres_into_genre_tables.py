@@ -0,0 +1,170 @@
+"""normalise genres into genre and link tables
+
+Revision ID: 5c8d0e2f6a93
+Revises: a41e7c9d2b58
+Create Date: 2026-10-17 11:26:52.190337
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from enums import Genres
+
+
+# revision identifiers, used by Alembic.
+revision = '5c8d0e2f6a93'
+down_revision = 'a41e7c9d2b58'
+branch_labels = None
+depends_on = None
+
+# (owner table, link table, owner column on the link table, Genre counter)
+OWNERS = [
+    ('Venue', 'VenueGenre', 'venue_id', 'venue_count'),
+    ('Artist', 'ArtistGenre', 'artist_id', 'artist_count'),
+]
+
+# The search document now reads genre names from the link tables, which a
+# generated column cannot do, so it is kept up to date by triggers instead.
+SEARCH_VECTOR_FUNCTION = """
+CREATE FUNCTION "{owner}_search_vector"() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('simple', coalesce(NEW.name, '')), 'A') ||
+        setweight(to_tsvector('simple',
+            coalesce(NEW.city, '') || ' ' || coalesce(NEW.state, '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce((
+            SELECT string_agg(g.name, ' ')
+            FROM "{link}" l JOIN "Genre" g ON g.id = l.genre_id
+            WHERE l.{owner_id} = NEW.id), '')), 'C');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql
+"""
+
+SEARCH_VECTOR_TRIGGER = """
+CREATE TRIGGER "{owner}_search_vector"
+BEFORE INSERT OR UPDATE OF name, city, state, search_vector ON "{owner}"
+FOR EACH ROW EXECUTE PROCEDURE "{owner}_search_vector"()
+"""
+
+# Any change to an owner's genres re-runs the owner's search_vector trigger
+# and moves the per-genre counter.
+LINK_FUNCTION = """
+CREATE FUNCTION "{link}_changed"() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE "Genre" SET {counter} = {counter} + 1 WHERE id = NEW.genre_id;
+        UPDATE "{owner}" SET search_vector = NULL WHERE id = NEW.{owner_id};
+    ELSE
+        UPDATE "Genre" SET {counter} = {counter} - 1 WHERE id = OLD.genre_id;
+        UPDATE "{owner}" SET search_vector = NULL WHERE id = OLD.{owner_id};
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql
+"""
+
+LINK_TRIGGER = """
+CREATE TRIGGER "{link}_changed"
+AFTER INSERT OR DELETE ON "{link}"
+FOR EACH ROW EXECUTE PROCEDURE "{link}_changed"()
+"""
+
+# Same expression as migration 3f1c2b9a7d10, for downgrade.
+GENERATED_SEARCH_VECTOR_SQL = (
+    "setweight(to_tsvector('simple', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('simple', "
+    "coalesce(city, '') || ' ' || coalesce(state, '')), 'B') || "
+    "setweight(to_tsvector('simple', coalesce(genres, '')), 'C')"
+)
+
+
+def upgrade():
+    genre_table = op.create_table('Genre',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('venue_count', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('artist_count', sa.Integer(), server_default='0', nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    op.bulk_insert(genre_table, [{'name': genre.name} for genre in Genres])
+
+    for owner, link, owner_id, counter in OWNERS:
+        op.create_table(link,
+        sa.Column(owner_id, sa.Integer(), nullable=False),
+        sa.Column('genre_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['genre_id'], ['Genre.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint([owner_id], [f'{owner}.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint(owner_id, 'genre_id')
+        )
+        op.create_index(
+            f'ix_{link}_genre_id_{owner_id}', link, ['genre_id', owner_id])
+
+        # Copy the JSON lists over; names outside the enum are kept too.
+        op.execute(f"""
+            INSERT INTO "Genre" (name)
+            SELECT DISTINCT e.name
+            FROM "{owner}" o,
+                 json_array_elements_text(o.genres::json) AS e(name)
+            WHERE coalesce(o.genres, '') <> ''
+            ON CONFLICT (name) DO NOTHING
+        """)
+        op.execute(f"""
+            INSERT INTO "{link}" ({owner_id}, genre_id)
+            SELECT DISTINCT o.id, g.id
+            FROM "{owner}" o,
+                 json_array_elements_text(o.genres::json) AS e(name),
+                 "Genre" g
+            WHERE coalesce(o.genres, '') <> '' AND g.name = e.name
+        """)
+        op.execute(f"""
+            UPDATE "Genre" g SET {counter} = (
+                SELECT count(*) FROM "{link}" l WHERE l.genre_id = g.id)
+        """)
+
+        # Replace the generated search_vector with a trigger-maintained one.
+        op.drop_column(owner, 'search_vector')
+        op.add_column(owner, sa.Column(
+            'search_vector', postgresql.TSVECTOR(), nullable=True))
+        names = dict(owner=owner, link=link, owner_id=owner_id,
+                     counter=counter)
+        op.execute(SEARCH_VECTOR_FUNCTION.format(**names))
+        op.execute(SEARCH_VECTOR_TRIGGER.format(**names))
+        op.execute(LINK_FUNCTION.format(**names))
+        op.execute(LINK_TRIGGER.format(**names))
+        op.drop_column(owner, 'genres')
+        op.execute(f'UPDATE "{owner}" SET search_vector = NULL')
+        op.create_index(
+            f'ix_{owner}_search_vector', owner, ['search_vector'],
+            postgresql_using='gin')
+
+
+def downgrade():
+    for owner, link, owner_id, counter in reversed(OWNERS):
+        length = 500 if owner == 'Venue' else 120
+        op.add_column(owner, sa.Column(
+            'genres', sa.String(length=length), nullable=True))
+        op.execute(f"""
+            UPDATE "{owner}" o SET genres = (
+                SELECT json_agg(g.name ORDER BY g.name)::text
+                FROM "{link}" l JOIN "Genre" g ON g.id = l.genre_id
+                WHERE l.{owner_id} = o.id)
+        """)
+        op.execute(f'DROP TRIGGER "{link}_changed" ON "{link}"')
+        op.execute(f'DROP FUNCTION "{link}_changed"()')
+        op.execute(f'DROP TRIGGER "{owner}_search_vector" ON "{owner}"')
+        op.execute(f'DROP FUNCTION "{owner}_search_vector"()')
+        op.drop_column(owner, 'search_vector')
+        op.add_column(owner, sa.Column(
+            'search_vector',
+            postgresql.TSVECTOR(),
+            sa.Computed(GENERATED_SEARCH_VECTOR_SQL, persisted=True)))
+        op.create_index(
+            f'ix_{owner}_search_vector', owner, ['search_vector'],
+            postgresql_using='gin')
+        op.drop_index(f'ix_{link}_genre_id_{owner_id}', table_name=link)
+        op.drop_table(link)
+
+    op.drop_table('Genre')
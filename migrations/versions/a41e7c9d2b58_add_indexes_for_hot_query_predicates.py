@@ -0,0 +1,44 @@
+"""add indexes for hot query predicates
+
+Revision ID: a41e7c9d2b58
+Revises: 3f1c2b9a7d10
+Create Date: 2026-10-17 10:03:15.874402
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a41e7c9d2b58'
+down_revision = '3f1c2b9a7d10'
+branch_labels = None
+depends_on = None
+
+# (name, table, columns). Built CONCURRENTLY, which cannot run inside a
+# transaction, so each statement gets its own autocommit block and a
+# populated database keeps accepting writes while they build.
+INDEXES = [
+    ('ix_Show_venue_id_start_time', 'Show', ['venue_id', 'start_time']),
+    ('ix_Show_artist_id_start_time', 'Show', ['artist_id', 'start_time']),
+    ('ix_Show_start_time_id', 'Show', ['start_time', 'id']),
+    ('ix_Venue_created_date', 'Venue', ['created_date']),
+    ('ix_Artist_created_date', 'Artist', ['created_date']),
+    ('ix_Venue_city_state_id', 'Venue', ['city', 'state', 'id']),
+]
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(
+                name, table, columns,
+                postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns in reversed(INDEXES):
+            op.drop_index(
+                name, table_name=table,
+                postgresql_concurrently=True)
@@ -0,0 +1,31 @@
+"""add updated_at to venue, artist and show tables
+
+Revision ID: b7f3e1a0c4d6
+Revises: 5c8d0e2f6a93
+Create Date: 2026-10-17 12:41:08.662915
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7f3e1a0c4d6'
+down_revision = '5c8d0e2f6a93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing rows start out as modified now (UTC, like the app's default).
+    for table in ('Venue', 'Artist', 'Show'):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(sa.Column(
+                'updated_at', sa.DateTime(), nullable=False,
+                server_default=sa.text("timezone('utc', now())")))
+
+
+def downgrade():
+    for table in ('Show', 'Artist', 'Venue'):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_column('updated_at')
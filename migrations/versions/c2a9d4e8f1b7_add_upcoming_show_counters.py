@@ -0,0 +1,48 @@
+"""add upcoming show counters to venue and artist tables
+
+Revision ID: c2a9d4e8f1b7
+Revises: b7f3e1a0c4d6
+Create Date: 2026-10-17 13:58:37.104552
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c2a9d4e8f1b7'
+down_revision = 'b7f3e1a0c4d6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('UpcomingShowWatermark',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('refreshed_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    # The app compares start_time with local naive datetime.now().
+    op.execute('INSERT INTO "UpcomingShowWatermark" (refreshed_at) '
+               'VALUES (LOCALTIMESTAMP)')
+
+    for table, owner_id in (('Venue', 'venue_id'), ('Artist', 'artist_id')):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(sa.Column(
+                'upcoming_show_count', sa.Integer(), server_default='0',
+                nullable=False))
+        op.execute(f"""
+            UPDATE "{table}" o SET upcoming_show_count = (
+                SELECT count(*) FROM "Show" s
+                WHERE s.{owner_id} = o.id
+                AND s.start_time > (
+                    SELECT refreshed_at FROM "UpcomingShowWatermark"))
+        """)
+
+
+def downgrade():
+    for table in ('Artist', 'Venue'):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_column('upcoming_show_count')
+
+    op.drop_table('UpcomingShowWatermark')
@@ -0,0 +1,46 @@
+"""add import keys to venue, artist and show tables
+
+Revision ID: e5b81f3c7a20
+Revises: c2a9d4e8f1b7
+Create Date: 2026-10-17 15:12:44.318265
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b81f3c7a20'
+down_revision = 'c2a9d4e8f1b7'
+branch_labels = None
+depends_on = None
+
+# ``flask import`` upserts on "<source>:<external id>". The unique indexes
+# are built CONCURRENTLY, outside the column migration's transaction.
+TABLES = ['Venue', 'Artist', 'Show']
+
+
+def upgrade():
+    for table in TABLES:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(sa.Column(
+                'import_key', sa.String(length=200), nullable=True))
+
+    with op.get_context().autocommit_block():
+        for table in TABLES:
+            op.create_index(
+                f'ix_{table}_import_key', table, ['import_key'],
+                unique=True,
+                postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for table in reversed(TABLES):
+            op.drop_index(
+                f'ix_{table}_import_key', table_name=table,
+                postgresql_concurrently=True)
+
+    for table in reversed(TABLES):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_column('import_key')
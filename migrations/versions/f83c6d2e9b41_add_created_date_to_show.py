@@ -0,0 +1,43 @@
+"""add created_date to show table
+
+Revision ID: f83c6d2e9b41
+Revises: e5b81f3c7a20
+Create Date: 2026-10-17 16:40:09.527130
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f83c6d2e9b41'
+down_revision = 'e5b81f3c7a20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('Show', schema=None) as batch_op:
+        batch_op.add_column(sa.Column(
+            'created_date', sa.DateTime(), nullable=True))
+
+    # Rows written before created_date was filled in on insert: the
+    # closest known time is their last update.
+    for table in ('Venue', 'Artist', 'Show'):
+        op.execute(f'UPDATE "{table}" SET created_date = updated_at '
+                   f'WHERE created_date IS NULL')
+
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_Show_created_date_id', 'Show', ['created_date', 'id'],
+            postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_Show_created_date_id', table_name='Show',
+            postgresql_concurrently=True)
+
+    with op.batch_alter_table('Show', schema=None) as batch_op:
+        batch_op.drop_column('created_date')
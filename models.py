@@ -1,132 +1,333 @@
-from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from collections import OrderedDict
 from datetime import datetime
+from engine import engine_options, init_engine
+from replicas import RoutingSQLAlchemy
+import replicas
 
-db = SQLAlchemy()
+db = RoutingSQLAlchemy()
 
 
 def setup_db(app):
     app.config.from_object('config')
+    app.config.from_envvar('FYYUR_SETTINGS', silent=True)
+    app.config.setdefault(
+        'SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config))
     db.app = app
     migrate = Migrate(app, db)
     db.init_app(app)
+    init_engine(db.engine, app.config)
+    replicas.init_app(app, db)
     return db
 
 
+def show_timeline_query(owner_column, owner_id, other, now=None,
+                        upcoming=None):
+    # The owner's shows joined with the other side's name and image, by
+    # start_time; ``upcoming`` True or False keeps one side of ``now``.
+    query = db.session.query(
+        Show.start_time, other.id, other.name, other.image_link)\
+        .join(other)\
+        .filter(owner_column == owner_id)
+    if upcoming is True:
+        query = query.filter(Show.start_time > now)
+    elif upcoming is False:
+        query = query.filter(Show.start_time <= now)
+    return query.order_by(Show.start_time)
+
+
+def build_show_timeline(rows, prefix, now):
+    # Rows of show_timeline_query, split into upcoming and past in one pass.
+    upcoming_shows = []
+    past_shows = []
+    for start_time, other_id, name, image_link in rows:
+        show = {
+            'start_time': start_time,
+            prefix + '_id': other_id,
+            prefix + '_name': name,
+            prefix + '_image_link': image_link,
+        }
+        if start_time > now:
+            upcoming_shows.append(show)
+        else:
+            past_shows.append(show)
+    return {
+        'upcoming_shows': upcoming_shows,
+        'past_shows': past_shows,
+        'upcoming_shows_count': len(upcoming_shows),
+        'past_shows_count': len(past_shows),
+    }
+
+
+def load_show_timeline(owner_column, owner_id, other, prefix):
+    # Shared by Venue.query_timeline and Artist.query_timeline: a single
+    # query for the owner's shows, split in Python.
+    now = datetime.now()
+    rows = show_timeline_query(owner_column, owner_id, other).all()
+    return build_show_timeline(rows, prefix, now)
+
+
+def page_validator_query(owner, owner_id, owner_column, other, now):
+    # Everything a detail page's content depends on, in one aggregate row:
+    # the owner's own updated_at, the newest change to its shows or to the
+    # venues/artists they link to, the number of shows (catches deletes) and
+    # the next upcoming start time (the page changes once it passes).
+    # The row is missing when the owner does not exist.
+    return db.session.query(
+        owner.updated_at,
+        db.func.max(Show.updated_at),
+        db.func.max(other.updated_at),
+        db.func.count(Show.id),
+        db.func.min(db.case(
+            [(Show.start_time > now, Show.start_time)])))\
+        .select_from(owner)\
+        .outerjoin(Show, owner_column == owner.id)\
+        .outerjoin(other)\
+        .filter(owner.id == owner_id)\
+        .group_by(owner.id, owner.updated_at)
+
+
+def load_page_validator(owner, owner_id, owner_column, other):
+    # page_validator_query's row, or None when the owner does not exist.
+    return page_validator_query(
+        owner, owner_id, owner_column, other, datetime.now()).first()
+
+
+def genre_names_query(owner_column, ids):
+    # (owner id, genre name) rows for ``ids``; ``owner_column`` is the owner
+    # side of a link table, e.g. venue_genres.c.venue_id.
+    return db.session.query(owner_column, Genre.name)\
+        .join(Genre, Genre.id == owner_column.table.c.genre_id)\
+        .filter(owner_column.in_(ids))\
+        .order_by(Genre.name)
+
+
+def group_genre_names(rows, ids):
+    genres = {ident: [] for ident in ids}
+    for ident, name in rows:
+        genres[ident].append(name)
+    return genres
+
+
+def load_genre_names(owner_column, ids):
+    # {owner id: [genre names]} for ``ids`` in one query.
+    return group_genre_names(genre_names_query(owner_column, ids), ids)
+
+
 # ----------------------------------------------------------------------------#
 # Models.
 # ----------------------------------------------------------------------------#
 
-class Venue(db.Model):
+class Genre(db.Model):
+    __tablename__ = 'Genre'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), nullable=False, unique=True)
+    # Maintained by triggers on the link tables (migration 5c8d0e2f6a93).
+    venue_count = db.Column(db.Integer, nullable=False, server_default='0')
+    artist_count = db.Column(
+        db.Integer, nullable=False, server_default='0')
+
+    @classmethod
+    def lookup(cls, names):
+        if not names:
+            return []
+        return cls.query.filter(cls.name.in_(names)).order_by(cls.name).all()
+
+
+venue_genres = db.Table(
+    'VenueGenre',
+    db.Column('venue_id', db.Integer,
+              db.ForeignKey('Venue.id', ondelete='CASCADE'),
+              primary_key=True),
+    db.Column('genre_id', db.Integer,
+              db.ForeignKey('Genre.id', ondelete='CASCADE'),
+              primary_key=True),
+    db.Index('ix_VenueGenre_genre_id_venue_id', 'genre_id', 'venue_id'))
+
+artist_genres = db.Table(
+    'ArtistGenre',
+    db.Column('artist_id', db.Integer,
+              db.ForeignKey('Artist.id', ondelete='CASCADE'),
+              primary_key=True),
+    db.Column('genre_id', db.Integer,
+              db.ForeignKey('Genre.id', ondelete='CASCADE'),
+              primary_key=True),
+    db.Index('ix_ArtistGenre_genre_id_artist_id', 'genre_id', 'artist_id'))
+
+
+class ViewMixin(object):
+    # Plain-dict copy of the row for templates, forms and the object cache.
+
+    @classmethod
+    def view_columns(cls):
+        return [
+            column for column in cls.__table__.columns
+            if column.key not in (
+                'search_vector', 'upcoming_show_count', 'import_key')]
+
+    def to_view(self):
+        view = {
+            column.key: getattr(self, column.key)
+            for column in self.view_columns()
+        }
+        view['genres'] = self.genres
+        return view
+
+
+class GenresMixin(object):
+    # ``genres`` reads and writes genre names, which is what the forms and
+    # templates deal in; the rows live in the ``genre_list`` relationship.
+
+    @property
+    def genres(self):
+        return [genre.name for genre in self.genre_list]
+
+    @genres.setter
+    def genres(self, names):
+        # No autoflush: form.populate_obj would otherwise flush the fields
+        # set so far, and the rest in a second UPDATE.
+        with db.session.no_autoflush:
+            self.genre_list = Genre.lookup(names)
+        # Link-table changes alone would not touch the owner's row.
+        self.updated_at = datetime.utcnow()
+
+
+class Venue(ViewMixin, GenresMixin, db.Model):
     __tablename__ = 'Venue'
+    __table_args__ = (
+        db.Index('ix_Venue_search_vector', 'search_vector',
+                 postgresql_using='gin'),
+        db.Index('ix_Venue_name_trgm', 'name', postgresql_using='gin',
+                 postgresql_ops={'name': 'gin_trgm_ops'}),
+        db.Index('ix_Venue_created_date', 'created_date'),
+        db.Index('ix_Venue_city_state_id', 'city', 'state', 'id'),
+        db.Index('ix_Venue_import_key', 'import_key', unique=True),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
-    city = db.Column(db.String(120))
-    state = db.Column(db.String(120))
+    # Not null: /venues pages through (city, state, id).
+    city = db.Column(db.String(120), nullable=False)
+    state = db.Column(db.String(120), nullable=False)
     address = db.Column(db.String(120))
     phone = db.Column(db.String(120))
-    genres = db.Column(db.String(500))
+    genre_list = db.relationship(
+        'Genre', secondary=venue_genres, order_by='Genre.name')
     facebook_link = db.Column(db.String(120))
     image_link = db.Column(db.String(500))
     website_link = db.Column(db.String(120))
     seeking_talent = db.Column(db.Boolean, default=False)
     seeking_description = db.Column(db.String(500))
-    created_date = db.Column(db.DateTime)
+    created_date = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow,
+        onupdate=datetime.utcnow)
+    # "<source>:<external id>" for rows loaded by ``flask import``.
+    import_key = db.Column(db.String(200))
+    # Shows starting after the UpcomingShowWatermark; see counters.py.
+    upcoming_show_count = db.Column(
+        db.Integer, nullable=False, default=0, server_default='0')
+    # Weighted name/location/genres document, maintained by triggers.
+    search_vector = db.deferred(db.Column(
+        TSVECTOR,
+        server_default=db.FetchedValue(),
+        server_onupdate=db.FetchedValue()))
     shows = db.relationship(
         'Show',
         backref='Venue',
-        lazy='joined',
+        lazy='select',
         cascade='all, delete')
 
-    def num_upcoming_shows(self):
-        return db.session.query(Show) .filter(
-            Show.venue_id == self.id,
-            Show.start_time > datetime.now()) .count()
-
-    def query_shows(self):
-        now = datetime.now()
-        upcoming_shows = db.session.query(Show, Artist).join(Artist)\
-            .filter(Show.venue_id == self.id, Show.start_time > now)\
-            .all()
-        past_shows = db.session.query(Show, Artist).join(Artist)\
-            .filter(Show.venue_id == self.id, Show.start_time <= now)\
-            .all()
-        self.upcoming_shows = [{
-            'start_time': str(show.start_time),
-            'artist_id': artist.id,
-            'artist_name': artist.name,
-            'artist_image_link': artist.image_link,
-        } for show, artist in upcoming_shows]
-        self.past_shows = [{
-            'start_time': str(show.start_time),
-            'artist_id': artist.id,
-            'artist_name': artist.name,
-            'artist_image_link': artist.image_link,
-        } for show, artist in past_shows]
-        self.upcoming_shows_count = db.session.query(Show)\
-            .filter(Show.venue_id == self.id, Show.start_time > now)\
-            .count()
-        self.past_shows_count = db.session.query(Show)\
-            .filter(Show.venue_id == self.id, Show.start_time <= now)\
-            .count()
+    @classmethod
+    def query_areas(cls):
+        return db.session.query(
+            cls.id,
+            cls.name,
+            cls.city,
+            cls.state,
+            cls.upcoming_show_count.label('num_upcoming_shows'))
+
+    @staticmethod
+    def group_areas(rows):
+        # Rows must arrive ordered by (city, state).
+        areas = OrderedDict()
+        for row in rows:
+            areas.setdefault((row.city, row.state), list()).append({
+                'id': row.id,
+                'name': row.name,
+                'num_upcoming_shows': row.num_upcoming_shows
+            })
+        return [{'city': k[0], 'state': k[1], 'venues': v}
+                for k, v in areas.items()]
+
+    @classmethod
+    def query_timeline(cls, venue_id):
+        return load_show_timeline(Show.venue_id, venue_id, Artist, 'artist')
+
+    @classmethod
+    def page_validator(cls, venue_id):
+        return load_page_validator(cls, venue_id, Show.venue_id, Artist)
 
     # DONE: implement any missing fields, as a database migration using
     # Flask-Migrate
 
 
-class Artist(db.Model):
+class Artist(ViewMixin, GenresMixin, db.Model):
     __tablename__ = 'Artist'
+    __table_args__ = (
+        db.Index('ix_Artist_search_vector', 'search_vector',
+                 postgresql_using='gin'),
+        db.Index('ix_Artist_name_trgm', 'name', postgresql_using='gin',
+                 postgresql_ops={'name': 'gin_trgm_ops'}),
+        db.Index('ix_Artist_created_date', 'created_date'),
+        db.Index('ix_Artist_import_key', 'import_key', unique=True),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
     phone = db.Column(db.String(120))
-    genres = db.Column(db.String(120))
+    genre_list = db.relationship(
+        'Genre', secondary=artist_genres, order_by='Genre.name')
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
     website_link = db.Column(db.String(120))
     seeking_venue = db.Column(db.Boolean, default=False)
     seeking_description = db.Column(db.String(500))
-    created_date = db.Column(db.DateTime)
+    created_date = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow,
+        onupdate=datetime.utcnow)
+    # "<source>:<external id>" for rows loaded by ``flask import``.
+    import_key = db.Column(db.String(200))
+    # Shows starting after the UpcomingShowWatermark; see counters.py.
+    upcoming_show_count = db.Column(
+        db.Integer, nullable=False, default=0, server_default='0')
+    # Weighted name/location/genres document, maintained by triggers.
+    search_vector = db.deferred(db.Column(
+        TSVECTOR,
+        server_default=db.FetchedValue(),
+        server_onupdate=db.FetchedValue()))
     shows = db.relationship(
         'Show',
         backref='Artist',
-        lazy='joined',
+        lazy='select',
         cascade='all, delete')
 
-    def num_upcoming_shows(self):
-        return db.session.query(Show) .filter(
-            Show.artist_id == self.id,
-            Show.start_time > datetime.now()) .count()
-
-    def query_shows(self):
-        now = datetime.now()
-        upcoming_shows = db.session.query(Show, Venue).join(Venue)\
-            .filter(Show.artist_id == self.id, Show.start_time > now)\
-            .all()
-        past_shows = db.session.query(Show, Venue).join(Venue)\
-            .filter(Show.artist_id == self.id, Show.start_time <= now)\
-            .all()
-        self.upcoming_shows = [{
-            'start_time': str(show.start_time),
-            'venue_id': venue.id,
-            'venue_name': venue.name,
-            'venue_image_link': venue.image_link,
-        } for show, venue in upcoming_shows]
-        self.past_shows = [{
-            'start_time': str(show.start_time),
-            'venue_id': venue.id,
-            'venue_name': venue.name,
-            'venue_image_link': venue.image_link,
-        } for show, venue in past_shows]
-        self.upcoming_shows_count = db.session.query(Show)\
-            .filter(Show.artist_id == self.id, Show.start_time > now)\
-            .count()
-        self.past_shows_count = db.session.query(Show)\
-            .filter(Show.artist_id == self.id, Show.start_time <= now)\
-            .count()
+    @classmethod
+    def query_timeline(cls, artist_id):
+        return load_show_timeline(Show.artist_id, artist_id, Venue, 'venue')
+
+    @classmethod
+    def page_validator(cls, artist_id):
+        return load_page_validator(cls, artist_id, Show.artist_id, Venue)
 
     # DONE: implement any missing fields, as a database migration using
     # Flask-Migrate
@@ -137,6 +338,13 @@ class Artist(db.Model):
 
 class Show(db.Model):
     __tablename__ = 'Show'
+    __table_args__ = (
+        db.Index('ix_Show_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_Show_artist_id_start_time', 'artist_id', 'start_time'),
+        db.Index('ix_Show_start_time_id', 'start_time', 'id'),
+        db.Index('ix_Show_import_key', 'import_key', unique=True),
+        db.Index('ix_Show_created_date_id', 'created_date', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     artist_id = db.Column(
@@ -145,3 +353,31 @@ class Show(db.Model):
         nullable=False)
     venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False)
     start_time = db.Column(db.DateTime, nullable=False)
+    import_key = db.Column(db.String(200))
+    created_date = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow,
+        onupdate=datetime.utcnow)
+
+    @classmethod
+    def query_listing(cls):
+        # Column-only rows for the shows list: no ORM instances are built.
+        return db.session.query(
+            cls.id,
+            cls.start_time,
+            Venue.id.label('venue_id'),
+            Venue.name.label('venue_name'),
+            Artist.id.label('artist_id'),
+            Artist.name.label('artist_name'),
+            Artist.image_link.label('artist_image_link'))\
+            .join(Venue).join(Artist)
+
+
+class UpcomingShowWatermark(db.Model):
+    # Single row: the instant upcoming_show_count values are relative to.
+    __tablename__ = 'UpcomingShowWatermark'
+
+    id = db.Column(db.Integer, primary_key=True)
+    refreshed_at = db.Column(db.DateTime, nullable=False)
@@ -0,0 +1,143 @@
+import base64
+import json
+from collections import namedtuple
+from datetime import datetime
+from flask import abort, current_app, request
+from sqlalchemy import and_, or_, tuple_
+from models import db
+
+# Keyset (cursor) pagination. A page is selected with a WHERE on the sort
+# key of the last row seen instead of an OFFSET, so page N costs the same as
+# page 1. Cursors encode the full (sort_key, ..., id) tuple of a boundary row
+# and travel in the ``after``/``before`` query arguments.
+
+Sort = namedtuple('Sort', 'column descending getter')
+Page = namedtuple('Page', 'items next_cursor prev_cursor')
+
+
+def asc(column, getter=None):
+    return Sort(column, False, getter or _attribute_getter(column))
+
+
+def desc(column, getter=None):
+    return Sort(column, True, getter or _attribute_getter(column))
+
+
+def _attribute_getter(column):
+    return lambda row: getattr(row, column.key)
+
+
+def encode_cursor(values):
+    raw = json.dumps([
+        value.isoformat() if isinstance(value, datetime) else value
+        for value in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, sort):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(sort):
+            raise ValueError(cursor)
+        return [
+            datetime.fromisoformat(value)
+            if isinstance(key.column.type, db.DateTime) and value is not None
+            else value
+            for key, value in zip(sort, values)]
+    except (ValueError, TypeError):
+        abort(400)
+
+
+def _after(sort, values, reverse):
+    # Rows strictly after ``values`` in the (possibly reversed) sort order.
+    def beyond(column, descending, value):
+        if descending != reverse:
+            return column < value
+        return column > value
+
+    directions = {key.descending for key in sort}
+    if len(directions) == 1:
+        # Uniform direction: a row-value comparison the index can serve.
+        return beyond(
+            tuple_(*[key.column for key in sort]),
+            directions.pop(),
+            tuple_(*values))
+    return or_(*[
+        and_(*[key.column == value
+               for key, value in zip(sort[:i], values[:i])],
+             beyond(sort[i].column, sort[i].descending, values[i]))
+        for i in range(len(sort))])
+
+
+def keyset_page(query, sort, after=None, before=None, per_page=None):
+    """Return one Page of ``query`` ordered by ``sort``.
+
+    ``after``/``before`` are cursors taken from a previous page; at most one
+    of them is used. The page always holds its rows in ``sort`` order.
+    """
+    per_page = per_page or current_app.config['PAGE_SIZE']
+    reverse = before is not None and after is None
+    cursor = before if reverse else after
+
+    query = query.order_by(None)
+    if cursor is not None:
+        query = query.filter(
+            _after(sort, decode_cursor(cursor, sort), reverse))
+    query = query.order_by(*[
+        key.column.desc() if key.descending != reverse else key.column.asc()
+        for key in sort])
+    items = query.limit(per_page + 1).all()
+
+    has_more = len(items) > per_page
+    items = items[:per_page]
+    if reverse:
+        items.reverse()
+    if not items:
+        return Page(items, None, None)
+
+    def cursor_of(row):
+        return encode_cursor([key.getter(row) for key in sort])
+
+    has_next = has_more if not reverse else True
+    has_prev = has_more if reverse else cursor is not None
+    return Page(
+        items,
+        cursor_of(items[-1]) if has_next else None,
+        cursor_of(items[0]) if has_prev else None)
+
+
+def request_page(query, sort, per_page=None, prefix=''):
+    # keyset_page driven by the ``after``/``before`` request arguments;
+    # ``prefix`` names them apart for pages listing more than one query.
+    return keyset_page(
+        query,
+        sort,
+        after=request.values.get(prefix + 'after'),
+        before=request.values.get(prefix + 'before'),
+        per_page=per_page)
+
+
+def wants_count(default=False):
+    # Whether to run estimate_count: ``with_count=1`` asks for it,
+    # ``with_count=0`` declines; otherwise ``default``.
+    value = request.values.get('with_count')
+    if value is None:
+        return default
+    return value.lower() in ('1', 'true', 'yes')
+
+
+def estimate_count(query):
+    """Planner row estimate for ``query`` on PostgreSQL, exact count elsewhere.
+
+    The estimate comes from EXPLAIN and never executes the query.
+    """
+    query = query.order_by(None)
+    if db.engine.dialect.name != 'postgresql':
+        return query.with_entities(db.func.count()).scalar()
+    compiled = query.statement.compile(dialect=db.engine.dialect)
+    plan = db.session.connection().exec_driver_sql(
+        'EXPLAIN (FORMAT JSON) ' + str(compiled), compiled.params).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Plan']['Plan Rows']
@@ -0,0 +1,106 @@
+import random
+import time
+from contextlib import contextmanager
+from flask import g, has_request_context, request, session
+from flask_sqlalchemy import SignallingSession, SQLAlchemy
+from sqlalchemy import create_engine, orm
+from engine import engine_options, init_engine
+
+# Read-replica routing.
+#
+# Each read-only request (GET/HEAD, or a view marked with @reads_only) is
+# pinned to one replica from DB_REPLICA_URLS, chosen at random, and every
+# statement its session runs goes there. Flushes always go to the primary,
+# and once a request has flushed, the rest of it reads from the primary
+# too. The same client's later requests also stay on the primary for
+# DB_STICKY_PRIMARY_SECONDS (tracked in the Flask session), so users see
+# their own writes despite replication lag.
+#
+# Code that must not read stale data (e.g. filling a shared cache) wraps
+# the read in ``with primary():``. Outside a request (CLI, migrations)
+# everything uses the primary.
+
+READ_METHODS = ('GET', 'HEAD')
+STICKY_KEY = 'db_primary_until'
+
+
+class RoutingSession(SignallingSession):
+
+    def get_bind(self, mapper=None, clause=None):
+        if not self._flushing:
+            replica = current_replica()
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+def reads_only(view):
+    # Lets a view that accepts POST (e.g. a search form) use a replica.
+    view.reads_only = True
+    return view
+
+
+def current_replica():
+    if not has_request_context():
+        return None
+    if g.get('db_wrote') or g.get('db_primary_depth'):
+        return None
+    return g.get('db_replica')
+
+
+@contextmanager
+def primary():
+    # Route the enclosed reads to the primary.
+    if not has_request_context():
+        yield
+        return
+    g.db_primary_depth = g.get('db_primary_depth', 0) + 1
+    try:
+        yield
+    finally:
+        g.db_primary_depth -= 1
+
+
+def engines(app):
+    # name -> replica engine
+    return app.extensions.get('replicas', {})
+
+
+def init_app(app, db):
+    replicas = {}
+    for i, url in enumerate(app.config['DB_REPLICA_URLS']):
+        name = f'replica{i}'
+        config = dict(app.config, SQLALCHEMY_DATABASE_URI=url)
+        replica = create_engine(url, **engine_options(config, name))
+        init_engine(replica, config)
+        replicas[name] = replica
+    app.extensions['replicas'] = replicas
+    if not replicas:
+        return
+
+    window = app.config['DB_STICKY_PRIMARY_SECONDS']
+
+    @app.before_request
+    def choose_replica():
+        view = app.view_functions.get(request.endpoint)
+        read_only = (request.method in READ_METHODS
+                     or getattr(view, 'reads_only', False))
+        if read_only and session.get(STICKY_KEY, 0) <= time.time():
+            g.db_replica = random.choice(list(replicas.values()))
+
+    @app.after_request
+    def stick_to_primary(response):
+        if g.get('db_wrote') and window:
+            session[STICKY_KEY] = time.time() + window
+        return response
+
+    @db.event.listens_for(db.session, 'after_flush')
+    def mark_write(db_session, flush_context):
+        if has_request_context():
+            g.db_wrote = True
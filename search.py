@@ -0,0 +1,59 @@
+import re
+from sqlalchemy import cast, func, literal, or_
+from sqlalchemy.dialects.postgresql import DOUBLE_PRECISION
+from models import db
+from pagination import asc, desc
+
+# Search for venues and artists. On PostgreSQL this matches against the
+# weighted ``search_vector`` column (prefix terms, so "Hop" finds
+# "The Musical Hop") or a trigram-indexed ILIKE on the name, and ranks the
+# rows by relevance. Other databases fall back to a plain ILIKE.
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def prefix_tsquery(search_term):
+    # "musical ho" -> "musical:* & ho:*"
+    words = WORD_RE.findall(search_term.lower())
+    return ' & '.join(word + ':*' for word in words)
+
+
+def like_pattern(search_term):
+    # Substring LIKE pattern matching ``search_term`` literally: "100%"
+    # must not match every name that starts with 100, nor "_" any one
+    # character.
+    escaped = search_term.replace('\\', '\\\\')\
+        .replace('%', '\\%').replace('_', '\\_')
+    return f'%{escaped}%'
+
+
+def search(model, search_term, columns=None):
+    """Return ``(query, sort)`` for rows of ``model`` matching ``search_term``.
+
+    The query yields ``(instance, rank)`` rows, or ``(*columns, rank)`` when
+    ``columns`` (which must include ``model.id``) are given; ``sort`` orders
+    them best first and is meant for pagination.keyset_page.
+    """
+    search_term = search_term.strip()
+    pattern = like_pattern(search_term)
+    tsquery = prefix_tsquery(search_term)
+    entities = columns or [model]
+    by_id = asc(model.id, None if columns else lambda row: row[0].id)
+    if db.engine.dialect.name != 'postgresql' or not tsquery:
+        query = db.session.query(*entities, literal(0).label('rank'))\
+            .filter(model.name.ilike(pattern, escape='\\'))
+        return query, [by_id]
+
+    ts_query = func.to_tsquery('simple', tsquery)
+    # ts_rank and similarity are real (float4); the cursor carries the rank
+    # back as a float8, which a float4 never compares equal to, so the
+    # keyset would match the boundary rows again. Rank in float8 throughout.
+    rank = cast(
+        func.ts_rank(model.search_vector, ts_query) +
+        func.similarity(model.name, search_term),
+        DOUBLE_PRECISION)
+    query = db.session.query(*entities, rank.label('rank'))\
+        .filter(or_(
+            model.search_vector.op('@@')(ts_query),
+            model.name.ilike(pattern, escape='\\')))
+    return query, [desc(rank, lambda row: row.rank), by_id]
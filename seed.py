@@ -0,0 +1,274 @@
+import itertools
+import random
+import time
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import with_appcontext
+
+import counters
+from enums import Genres
+from models import db, Venue, Artist, Show, Genre, venue_genres, artist_genres
+
+# Synthetic data: ``flask seed --scale 1k|100k|1M``.
+#
+# Fills Venue, Artist and Show with generated rows for benchmarks (see
+# bench.py). The scale is the number of shows, with a twentieth as many
+# venues and a tenth as many artists unless --venues/--artists say
+# otherwise. The data is skewed the way real listings are: cities, genres
+# and the venues and artists that get booked all follow Zipf-like
+# distributions, so a few cities and genres hold most rows and a few venues
+# host most shows. About a third of the shows are upcoming.
+#
+# The same --seed produces the same rows. Rows get import_key
+# "seed-<seed>:venue<n>" (artist<n>, show<n>), so one seed can only be
+# loaded once per database; load another seed to add more.
+#
+# Rows are inserted in batches with Core executemany, bypassing the ORM;
+# the upcoming counters are recounted at the end.
+
+SCALES = {'1k': 1000, '100k': 100000, '1M': 1000000}
+
+CITIES = [
+    ('New York', 'NY'), ('Los Angeles', 'CA'), ('Chicago', 'IL'),
+    ('San Francisco', 'CA'), ('Austin', 'TX'), ('Nashville', 'TN'),
+    ('Seattle', 'WA'), ('Boston', 'MA'), ('New Orleans', 'LA'),
+    ('Atlanta', 'GA'), ('Denver', 'CO'), ('Portland', 'OR'),
+    ('Philadelphia', 'PA'), ('Miami', 'FL'), ('Minneapolis', 'MN'),
+    ('Detroit', 'MI'), ('Houston', 'TX'), ('Washington', 'DC'),
+    ('Las Vegas', 'NV'), ('San Diego', 'CA'), ('Phoenix', 'AZ'),
+    ('Memphis', 'TN'), ('Kansas City', 'MO'), ('Pittsburgh', 'PA'),
+    ('Baltimore', 'MD'), ('St. Louis', 'MO'), ('Cleveland', 'OH'),
+    ('Salt Lake City', 'UT'), ('Albuquerque', 'NM'), ('Burlington', 'VT'),
+]
+
+STREETS = [
+    'Main St', 'Broadway', 'Market St', 'Mission St', 'Oak Ave',
+    'Elm St', 'Sunset Blvd', 'Grand Ave', 'Park Ave', 'Water St']
+
+ADJECTIVES = [
+    'Musical', 'Blue', 'Golden', 'Electric', 'Velvet', 'Silver', 'Crimson',
+    'Midnight', 'Rusty', 'Wild', 'Lucky', 'Hidden', 'Royal', 'Sonic',
+    'Humble', 'Loud', 'Quiet', 'Neon', 'Broken', 'Happy']
+
+VENUE_NOUNS = [
+    'Hop', 'Room', 'Hall', 'Lounge', 'Tavern', 'Garage', 'Ballroom',
+    'Theatre', 'Cellar', 'Warehouse', 'Station', 'Den', 'Club', 'Bar',
+    'Studio']
+
+ARTIST_NOUNS = [
+    'Petals', 'Wolves', 'Horns', 'Pilots', 'Strangers', 'Echoes', 'Kings',
+    'Saints', 'Rivers', 'Machines', 'Ghosts', 'Tigers', 'Lights', 'Bones',
+    'Sparrows']
+
+FIRST_NAMES = [
+    'Matt', 'Ana', 'Joe', 'Nina', 'Sam', 'Lee', 'Maya', 'Alex', 'Ruth',
+    'Omar', 'Iris', 'Theo', 'June', 'Kai', 'Vera']
+
+LAST_NAMES = [
+    'Quevado', 'Hart', 'Okafor', 'Lindqvist', 'Moreau', 'Tanaka', 'Reyes',
+    'Novak', 'Brooks', 'Silva', 'Kowalski', 'Haddad', 'Byrne', 'Ito',
+    'Varga']
+
+# Shows start between two years ago and one year ahead, in the evening.
+PAST_DAYS = 730
+FUTURE_DAYS = 365
+
+
+def zipf_weights(n, exponent=1.0):
+    # Cumulative weights of ranks 1..n for random.choices(cum_weights=...).
+    return list(itertools.accumulate(
+        1 / rank ** exponent for rank in range(1, n + 1)))
+
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Generator(object):
+
+    def __init__(self, seed, now):
+        self.random = random.Random(seed)
+        self.source = f'seed-{seed}'
+        self.now = now
+        self.genres = [genre.name for genre in Genres]
+        self.random.shuffle(self.genres)
+        self.genre_weights = zipf_weights(len(self.genres))
+        self.city_weights = zipf_weights(len(CITIES), 1.1)
+
+    def key(self, kind, number):
+        return f'{self.source}:{kind}{number}'
+
+    def phone(self):
+        return '{:03}-{:03}-{:04}'.format(
+            self.random.randint(200, 999), self.random.randint(200, 999),
+            self.random.randint(0, 9999))
+
+    def pick_genres(self, most):
+        genres = set(self.random.choices(
+            self.genres, cum_weights=self.genre_weights,
+            k=self.random.randint(1, most)))
+        return sorted(genres)
+
+    def created(self):
+        return self.now - timedelta(
+            seconds=self.random.randint(0, PAST_DAYS * 86400))
+
+    def owner(self, kind, number, name, most_genres):
+        city, state = self.random.choices(
+            CITIES, cum_weights=self.city_weights)[0]
+        created = self.created()
+        slug = name.lower().replace(' ', '')
+        row = {
+            'import_key': self.key(kind, number),
+            'name': name,
+            'city': city,
+            'state': state,
+            'phone': self.phone(),
+            'image_link': f'https://images.example.com/{slug}{number}.jpg',
+            'facebook_link': f'https://www.facebook.com/{slug}{number}',
+            'website_link': f'https://{slug}{number}.example.com',
+            'seeking_description': '',
+            'created_date': created,
+            'updated_at': created,
+        }
+        return row, self.pick_genres(most_genres)
+
+    def venue(self, number):
+        name = (f'The {self.random.choice(ADJECTIVES)} '
+                f'{self.random.choice(VENUE_NOUNS)}')
+        row, genres = self.owner('venue', number, name, 3)
+        row['address'] = (f'{self.random.randint(1, 2999)} '
+                          f'{self.random.choice(STREETS)}')
+        row['seeking_talent'] = self.random.random() < 0.3
+        return row, genres
+
+    def artist(self, number):
+        if self.random.random() < 0.6:
+            name = (f'{self.random.choice(ADJECTIVES)} '
+                    f'{self.random.choice(ARTIST_NOUNS)}')
+        else:
+            name = (f'{self.random.choice(FIRST_NAMES)} '
+                    f'{self.random.choice(LAST_NAMES)}')
+        row, genres = self.owner('artist', number, name, 2)
+        row['seeking_venue'] = self.random.random() < 0.3
+        return row, genres
+
+    def start_time(self):
+        day = self.random.randint(-PAST_DAYS, FUTURE_DAYS)
+        start = self.now.replace(hour=0, minute=0, second=0, microsecond=0)
+        return start + timedelta(
+            days=day,
+            hours=self.random.randint(18, 22),
+            minutes=self.random.choice((0, 30)))
+
+    def shows(self, count, venue_ids, artist_ids):
+        # Popularity ranks are shuffled so they do not follow id order.
+        venue_ids = list(venue_ids)
+        artist_ids = list(artist_ids)
+        self.random.shuffle(venue_ids)
+        self.random.shuffle(artist_ids)
+        venue_weights = zipf_weights(len(venue_ids), 0.8)
+        artist_weights = zipf_weights(len(artist_ids), 0.8)
+        for number in range(count):
+            start_time = self.start_time()
+            created = min(start_time - timedelta(days=30), self.now)
+            yield {
+                'import_key': self.key('show', number),
+                'venue_id': self.random.choices(
+                    venue_ids, cum_weights=venue_weights)[0],
+                'artist_id': self.random.choices(
+                    artist_ids, cum_weights=artist_weights)[0],
+                'start_time': start_time,
+                'created_date': created,
+                'updated_at': created,
+            }
+
+
+def insert_owners(connection, model, owner_column, rows, genre_ids):
+    # Inserts (row, genres) pairs and their genre links; returns the new ids
+    # in order. ``owner_column`` is the owner side of the link table.
+    table = model.__table__
+    connection.execute(table.insert(), [row for row, genres in rows])
+    keys = [row['import_key'] for row, genres in rows]
+    ids = dict(connection.execute(
+        db.select([table.c.import_key, table.c.id])
+        .where(table.c.import_key.in_(keys))).fetchall())
+    links = [
+        {owner_column.key: ids[row['import_key']],
+         'genre_id': genre_ids[name]}
+        for row, genres in rows for name in genres]
+    connection.execute(owner_column.table.insert(), links)
+    return [ids[key] for key in keys]
+
+
+def seed(venues, artists, shows, seed_value, batch_size, echo):
+    generator = Generator(seed_value, datetime.now())
+    genre_ids = dict(db.session.query(Genre.name, Genre.id))
+    missing = set(generator.genres) - set(genre_ids)
+    if missing:
+        raise click.ClickException(
+            f'Missing genres {", ".join(sorted(missing))}; '
+            f'run flask db upgrade first.')
+    connection = db.session.connection()
+    if connection.execute(
+            db.select([Venue.id])
+            .where(Venue.import_key == generator.key('venue', 0))).first():
+        raise click.ClickException(
+            f'Seed {seed_value} is already loaded; pick another --seed.')
+
+    owner_ids = {}
+    for model, owner_column, count, make in (
+            (Venue, venue_genres.c.venue_id, venues, generator.venue),
+            (Artist, artist_genres.c.artist_id, artists, generator.artist)):
+        start = time.perf_counter()
+        owner_ids[model] = []
+        for batch in batches(map(make, range(count)), batch_size):
+            owner_ids[model] += insert_owners(
+                connection, model, owner_column, batch, genre_ids)
+        echo(model, count, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    rows = generator.shows(shows, owner_ids[Venue], owner_ids[Artist])
+    for batch in batches(rows, batch_size):
+        connection.execute(Show.__table__.insert(), batch)
+    echo(Show, shows, time.perf_counter() - start)
+
+    for model in (Venue, Artist):
+        for ids in batches(owner_ids[model], batch_size):
+            counters.recount(connection, model, ids)
+    db.session.commit()
+
+
+def init_app(app):
+    app.cli.add_command(seed_command)
+
+
+@click.command('seed')
+@click.option('--scale', type=click.Choice(list(SCALES)), default='1k',
+              show_default=True, help='Number of shows.')
+@click.option('--venues', type=int,
+              help='Number of venues. Default: a twentieth of the shows.')
+@click.option('--artists', type=int,
+              help='Number of artists. Default: a tenth of the shows.')
+@click.option('--seed', 'seed_value', type=int, default=1, show_default=True,
+              help='Random seed; each seed can be loaded once.')
+@click.option('--batch-size', type=int, default=5000, show_default=True,
+              help='Rows per INSERT batch.')
+@with_appcontext
+def seed_command(scale, venues, artists, seed_value, batch_size):
+    """Fill the database with synthetic venues, artists and shows."""
+    shows = SCALES[scale]
+    venues = max(1, shows // 20) if venues is None else venues
+    artists = max(1, shows // 10) if artists is None else artists
+
+    def echo(model, count, seconds):
+        click.echo(f'{count} {model.__tablename__} rows in {seconds:.1f}s '
+                   f'({count / max(seconds, 1e-9):.0f} rows/s).')
+
+    seed(venues, artists, shows, seed_value, batch_size, echo)
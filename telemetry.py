@@ -0,0 +1,322 @@
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+from flask import g, has_request_context, request
+from jinja2 import Template
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Per-request performance telemetry.
+#
+# Every request records its latency, the number of SQL statements it ran
+# and their total time (engine events, so replicas and the async engines in
+# asgi.py count too), the time spent rendering templates and the response
+# size. Figures are aggregated per route into histograms that /metrics
+# exposes in the Prometheus text format, together with the cache and pool
+# counters, to scrapers holding ADMIN_TOKEN. Each response carries a Server-Timing header, and requests
+# slower than TELEMETRY_SLOW_REQUEST_MS are logged.
+#
+# Streamed responses are recorded when the server closes them, so their
+# latency, SQL and size cover the whole body; their Server-Timing header
+# is sent first and covers only the work done before the first chunk. The
+# render time of a streamed template includes the queries its lazy
+# context runs while rendering. SQL time is summed over statements, so on
+# the ASGI path, where a page's queries overlap, it can exceed the latency.
+#
+# The registry is per process: with several workers, each one reports
+# what it served.
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+class Histogram(object):
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            yield bound, total
+
+
+# name -> (help, buckets)
+HISTOGRAMS = {
+    'request_duration_seconds': (
+        'Request latency, until the last byte of the body.',
+        LATENCY_BUCKETS),
+    'request_sql_statements': (
+        'SQL statements executed per request.', STATEMENT_BUCKETS),
+    'request_sql_seconds': (
+        'Time spent executing SQL per request.', LATENCY_BUCKETS),
+    'request_render_seconds': (
+        'Time spent rendering templates per request.', LATENCY_BUCKETS),
+    'response_size_bytes': (
+        'Response body size.', SIZE_BUCKETS),
+}
+
+
+class RequestStats(object):
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.sql_statements = 0
+        self.sql_seconds = 0.0
+        self.render_seconds = 0.0
+        self.size = 0
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+
+class Metrics(object):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = Counter()
+        # (name, route, method) -> Histogram
+        self.histograms = {}
+
+    def record(self, route, method, status, stats, duration):
+        values = {
+            'request_duration_seconds': duration,
+            'request_sql_statements': stats.sql_statements,
+            'request_sql_seconds': stats.sql_seconds,
+            'request_render_seconds': stats.render_seconds,
+            'response_size_bytes': stats.size,
+        }
+        with self.lock:
+            self.requests[route, method, status] += 1
+            for name, value in values.items():
+                key = (name, route, method)
+                if key not in self.histograms:
+                    self.histograms[key] = Histogram(HISTOGRAMS[name][1])
+                self.histograms[key].observe(value)
+
+    def snapshot(self):
+        with self.lock:
+            histograms = {}
+            for (name, route, method), histogram in self.histograms.items():
+                histograms[name, route, method] = (
+                    list(histogram.cumulative()),
+                    histogram.count,
+                    histogram.sum)
+            return Counter(self.requests), histograms
+
+
+metrics = Metrics()
+
+
+def current_stats():
+    if has_request_context():
+        return g.get('telemetry')
+    return None
+
+
+class TimedTemplate(Template):
+    # Adds rendering time to the current request's stats.
+
+    def render(self, *args, **kwargs):
+        stats = current_stats()
+        if stats is None:
+            return super().render(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            stats.render_seconds += time.perf_counter() - start
+
+    def generate(self, *args, **kwargs):
+        stats = current_stats()
+        chunks = super().generate(*args, **kwargs)
+        if stats is None:
+            yield from chunks
+            return
+        while True:
+            start = time.perf_counter()
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                return
+            finally:
+                stats.render_seconds += time.perf_counter() - start
+            yield chunk
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    # On the execution context rather than the connection: a statement
+    # that never reaches after_cursor_execute (a listener raising, a
+    # failed execute) takes its start time with it.
+    if context is not None:
+        context.telemetry_start = time.perf_counter()
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context,
+                         executemany):
+    start = getattr(context, 'telemetry_start', None)
+    stats = current_stats()
+    if stats is not None and start is not None:
+        stats.sql_statements += 1
+        stats.sql_seconds += time.perf_counter() - start
+
+
+def counted(chunks, stats):
+    # Streamed bodies: count bytes as they are sent.
+    try:
+        for chunk in chunks:
+            stats.size += len(chunk)
+            yield chunk
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
+
+
+def server_timing(stats):
+    return ', '.join([
+        f'app;dur={stats.elapsed() * 1000:.1f}',
+        f'db;dur={stats.sql_seconds * 1000:.1f};'
+        f'desc="{stats.sql_statements} queries"',
+        f'render;dur={stats.render_seconds * 1000:.1f}',
+    ])
+
+
+def init_app(app):
+    app.jinja_env.template_class = TimedTemplate
+    if not event.contains(Engine, 'before_cursor_execute',
+                          before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', after_cursor_execute)
+
+    @app.before_request
+    def start_request():
+        g.telemetry = RequestStats()
+
+    @app.after_request
+    def finish_request(response):
+        stats = g.get('telemetry')
+        if stats is None:
+            return response
+        response.headers['Server-Timing'] = server_timing(stats)
+        if response.is_streamed:
+            response.response = counted(response.response, stats)
+        else:
+            stats.size = response.calculate_content_length() or 0
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        method = request.method
+        path = request.full_path.rstrip('?')
+        status = response.status_code
+        request_id = g.get('request_id')
+        slow = app.config['TELEMETRY_SLOW_REQUEST_MS'] / 1000
+
+        def record():
+            duration = stats.elapsed()
+            metrics.record(route, method, status, stats, duration)
+            if slow and duration >= slow:
+                # The request context is gone by now; see logs.py.
+                app.logger.warning(
+                    'Slow request: %s %s (%s) %d in %.0f ms; %d SQL '
+                    'statements in %.0f ms, render %.0f ms, %d bytes',
+                    method, path, route, status, duration * 1000,
+                    stats.sql_statements, stats.sql_seconds * 1000,
+                    stats.render_seconds * 1000, stats.size,
+                    extra={
+                        'request_id': request_id,
+                        'route': route,
+                        'method': method,
+                        'path': path,
+                        'status': status,
+                        'duration_ms': round(duration * 1000, 1),
+                        'sql_statements': stats.sql_statements,
+                        'sql_ms': round(stats.sql_seconds * 1000, 1),
+                        'render_ms': round(stats.render_seconds * 1000, 1),
+                        'size': stats.size,
+                    })
+
+        response.call_on_close(record)
+        return response
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')\
+        .replace('\n', '\\n')
+
+
+def labels(**values):
+    return '{' + ','.join(
+        f'{name}="{escape(value)}"' for name, value in values.items()) + '}'
+
+
+def exposition(cache_stats, pools):
+    """The Prometheus text format of the request metrics, ``cache_stats``
+    (Cache.stats()) and ``pools`` (name -> engine.pool_stats()).
+    """
+    requests, histograms = metrics.snapshot()
+    lines = [
+        '# HELP fyyur_requests_total Requests served.',
+        '# TYPE fyyur_requests_total counter',
+    ]
+    for (route, method, status), count in sorted(requests.items()):
+        lines.append('fyyur_requests_total' + labels(
+            route=route, method=method, status=status) + f' {count}')
+
+    by_name = defaultdict(list)
+    for (name, route, method), value in sorted(histograms.items()):
+        by_name[name].append((route, method, value))
+    for name, (help, _) in HISTOGRAMS.items():
+        metric = 'fyyur_' + name
+        lines.append(f'# HELP {metric} {help}')
+        lines.append(f'# TYPE {metric} histogram')
+        for route, method, (buckets, count, total) in by_name[name]:
+            for bound, cumulative in buckets:
+                lines.append(f'{metric}_bucket' + labels(
+                    route=route, method=method, le=bound) + f' {cumulative}')
+            lines.append(f'{metric}_count' + labels(
+                route=route, method=method) + f' {count}')
+            lines.append(f'{metric}_sum' + labels(
+                route=route, method=method) + f' {total}')
+
+    for kind in ('hits', 'misses'):
+        metric = f'fyyur_cache_{kind}_total'
+        lines.append(f'# HELP {metric} Object cache {kind}.')
+        lines.append(f'# TYPE {metric} counter')
+        for namespace, stats in cache_stats.items():
+            lines.append(
+                metric + labels(namespace=namespace) + f' {stats[kind]}')
+
+    pool_metrics = [
+        ('checked_out', 'gauge', 'Connections in use.'),
+        ('idle', 'gauge', 'Idle connections in the pool.'),
+        ('overflow', 'gauge', 'Connections beyond pool_size.'),
+        ('checkouts', 'counter', 'Connection checkouts.'),
+        ('timeouts', 'counter', 'Checkouts that timed out.'),
+        ('wait_seconds_total', 'counter', 'Time spent checking out.'),
+        ('wait_seconds_max', 'gauge', 'Longest checkout.'),
+    ]
+    for key, kind, help in pool_metrics:
+        metric = 'fyyur_db_pool_' + key
+        if kind == 'counter' and not key.endswith('_total'):
+            metric += '_total'
+        lines.append(f'# HELP {metric} {help}')
+        lines.append(f'# TYPE {metric} {kind}')
+        for name, stats in pools.items():
+            if key in stats:
+                lines.append(metric + labels(pool=name) + f' {stats[key]}')
+    return '\n'.join(lines) + '\n'
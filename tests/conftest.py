@@ -0,0 +1,77 @@
+import os
+
+import pytest
+
+# The tests run against a PostgreSQL database named by TEST_DATABASE_URL,
+# which they wipe: the schema is dropped and rebuilt from the migrations
+# before each data set is seeded. Without it every test is skipped.
+#
+#     TEST_DATABASE_URL=postgresql://postgres@localhost/fyyur_test pytest
+#
+# TEST_SEED_SCALES lists the ``flask seed --scale`` sizes to run the tests
+# at (default 1k,100k); tests using ``seeded`` run once per size.
+
+DATABASE_URL = os.environ.get('TEST_DATABASE_URL')
+SCALES = os.environ.get('TEST_SEED_SCALES', '1k,100k').split(',')
+MIGRATIONS = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+
+# Read by config.py when app is first imported.
+if DATABASE_URL:
+    os.environ['DATABASE_URL'] = DATABASE_URL
+os.environ['LOG_FILE'] = ''
+os.environ.pop('FYYUR_SETTINGS', None)
+
+
+@pytest.fixture(scope='session')
+def app():
+    if not DATABASE_URL:
+        pytest.skip('TEST_DATABASE_URL is not set')
+    from app import app
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    return app
+
+
+def reset_database(app):
+    from flask_migrate import upgrade
+    from cache import cache
+    from models import db
+
+    db.session.remove()
+    with db.engine.begin() as connection:
+        connection.exec_driver_sql(
+            'DROP SCHEMA public CASCADE; CREATE SCHEMA public')
+    upgrade(directory=MIGRATIONS)
+    # Ids start over; entries cached for the last data set would match.
+    cache.init_app(app)
+
+
+@pytest.fixture(scope='session', params=SCALES)
+def seeded(request, app):
+    """The scale name, once the database holds a fresh seed of that size."""
+    from models import db
+
+    with app.app_context():
+        reset_database(app)
+        result = app.test_cli_runner().invoke(
+            args=['seed', '--scale', request.param])
+        assert result.exit_code == 0, result.output
+        with db.engine.connect() as connection:
+            connection.execution_options(isolation_level='AUTOCOMMIT')\
+                .exec_driver_sql('ANALYZE')
+    return request.param
+
+
+@pytest.fixture
+def client(app, seeded):
+    with app.app_context():
+        yield app.test_client()
+
+
+@pytest.fixture
+def small_pages(app):
+    """Five rows a page, so the seeded lists span many pages."""
+    page_size = app.config['PAGE_SIZE']
+    app.config['PAGE_SIZE'] = 5
+    yield
+    app.config['PAGE_SIZE'] = page_size
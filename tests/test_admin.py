@@ -0,0 +1,24 @@
+import pytest
+
+# The operational endpoints answer only to the ADMIN_TOKEN bearer token,
+# and not at all while it is unset.
+
+PATHS = ['/metrics', '/cache/stats', '/db/pool/stats']
+
+
+@pytest.fixture
+def token(app):
+    yield 'admin-test-token'
+    app.config['ADMIN_TOKEN'] = ''
+
+
+@pytest.mark.parametrize('path', PATHS)
+def test_admin_only(app, client, token, path):
+    assert client.get(path).status_code == 404
+
+    app.config['ADMIN_TOKEN'] = token
+    assert client.get(path).status_code == 403
+    assert client.get(
+        path, headers={'Authorization': 'Bearer wrong'}).status_code == 403
+    assert client.get(
+        path, headers={'Authorization': f'Bearer {token}'}).status_code == 200
@@ -0,0 +1,29 @@
+from models import db, Venue, Show
+from test_loading import busiest
+
+# Revalidation of the detail pages. Their validator is the ETag alone: the
+# page changes when a show is deleted or passes, which moves no timestamp,
+# so a client revalidating with If-Modified-Since gets the page again.
+
+
+def test_show_delete_changes_the_etag(client):
+    ident, shows, genres = busiest(Venue, Show.venue_id, offset=2)
+    path = f'/venues/{ident}'
+    response = client.get(path)
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+    assert 'Last-Modified' not in response.headers
+    assert client.get(
+        path, headers={'If-None-Match': etag}).status_code == 304
+
+    show = Show.query.filter(Show.venue_id == ident).first()
+    db.session.delete(show)
+    db.session.commit()
+    db.session.remove()
+
+    assert client.get(
+        path, headers={'If-None-Match': etag}).status_code == 200
+    response = client.get(
+        path, headers={'If-Modified-Since': 'Fri, 01 Jan 2100 00:00:00 GMT'})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
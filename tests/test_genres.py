@@ -0,0 +1,35 @@
+import re
+
+import pytest
+
+from models import db, Genre
+
+# The genre page's venue and artist lists, each paged to the end through
+# its own cursor: every linked owner exactly once, as many as the counter
+# on the Genre row.
+
+NEXT = re.compile(r'<li class="next"><a href="([^"]*)"')
+
+
+@pytest.mark.parametrize('section, prefix, counter', [
+    (0, 'venues', 'venue_count'),
+    (1, 'artists', 'artist_count'),
+])
+def test_pages_to_the_end(client, small_pages, section, prefix, counter):
+    genre = Genre.query.order_by(getattr(Genre, counter).desc()).first()
+    name, total = genre.name, getattr(genre, counter)
+    db.session.remove()
+
+    ids, url = [], f'/genres/{name}'
+    while url:
+        html = client.get(url).get_data(as_text=True)
+        # The page's two lists, each in its own <section> with its pager.
+        html = html.split('<section>')[1 + section]
+        ids += re.findall(rf'href="/{prefix}/(\d+)"', html)
+        link = NEXT.search(html)
+        url = link.group(1).replace('&amp;', '&') if link else None
+        assert len(ids) <= total, 'a page repeated'
+
+    assert total > 5
+    assert len(ids) == len(set(ids))
+    assert len(ids) == total
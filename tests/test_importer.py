@@ -0,0 +1,49 @@
+import json
+
+from models import Venue, Show
+
+# ``flask import`` counts as loaded the rows its upserts wrote: a key
+# repeated within a batch is one row, and a show naming an unknown venue
+# is rejected rather than loaded.
+
+VENUE = {
+    'name': 'Imported Hall', 'city': 'San Francisco', 'state': 'CA',
+    'address': '1 Import St', 'phone': '415-000-0000', 'genres': ['Jazz'],
+    'facebook_link': 'https://www.facebook.com/importedhall'}
+ARTIST = {
+    'name': 'Imported Band', 'city': 'San Francisco', 'state': 'CA',
+    'phone': '415-000-0000', 'genres': ['Jazz'],
+    'facebook_link': 'https://www.facebook.com/importedband'}
+SHOW = {'venue_id': 'v1', 'artist_id': 'a1',
+        'start_time': '2030-01-01 20:00:00'}
+
+
+def run_import(app, tmp_path, kind, rows):
+    path = tmp_path / f'{kind}.ndjson'
+    path.write_text(''.join(json.dumps(row) + '\n' for row in rows))
+    result = app.test_cli_runner().invoke(
+        args=['import', kind, str(path), '--source', 'import-test'])
+    assert result.exit_code == 0, result.output
+    return result.output
+
+
+def test_loaded_counts_upserted_rows(app, client, tmp_path):
+    output = run_import(app, tmp_path, 'venues', [
+        dict(VENUE, external_id='v1'),
+        dict(VENUE, external_id='v1', name='Imported Hall (renamed)'),
+        dict(VENUE, external_id='v2'),
+    ])
+    assert '3 rows' in output and '2 loaded, 0 rejected' in output
+    run_import(app, tmp_path, 'artists', [dict(ARTIST, external_id='a1')])
+
+    output = run_import(app, tmp_path, 'shows', [
+        dict(SHOW, external_id='s1'),
+        dict(SHOW, external_id='s1'),
+        dict(SHOW, external_id='s2', venue_id='v9'),
+    ])
+    assert '3 rows' in output and '1 loaded, 1 rejected' in output
+
+    assert Venue.query.filter(
+        Venue.import_key.like('import-test:%')).count() == 2
+    assert Show.query.filter(
+        Show.import_key.like('import-test:%')).count() == 1
@@ -0,0 +1,108 @@
+import pytest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from cache import cache
+from models import db, Venue, Artist, Show, venue_genres, artist_genres
+
+# Statements and rows each route reads. A view that loads a relationship it
+# does not need (shows joined onto every venue) reads rows in proportion to
+# the shows of the data set; these bound the rows by what the page shows,
+# for the venue and artist with the most shows.
+
+
+class Reads(object):
+    # Statements run and rows returned by SELECTs while active; connection
+    # setup (engine.py) is not the view's.
+
+    def __init__(self):
+        self.statements = 0
+        self.rows = 0
+
+    def __call__(self, conn, cursor, statement, parameters, context,
+                 executemany):
+        if context is not None and \
+                context.execution_options.get('connection_setup'):
+            return
+        self.statements += 1
+        if cursor.description is not None:
+            self.rows += max(cursor.rowcount, 0)
+
+    def __enter__(self):
+        event.listen(Engine, 'after_cursor_execute', self)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(Engine, 'after_cursor_execute', self)
+
+
+def busiest(model, owner_column, offset=0):
+    # (id, shows, genres) of the owner with the most shows.
+    ident, shows = db.session.query(owner_column, db.func.count(Show.id))\
+        .group_by(owner_column)\
+        .order_by(db.func.count(Show.id).desc(), owner_column)\
+        .offset(offset).first()
+    link = venue_genres if model is Venue else artist_genres
+    genres = db.session.query(db.func.count()).select_from(link)\
+        .filter(list(link.c)[0] == ident).scalar()
+    db.session.remove()
+    return ident, shows, genres
+
+
+def read(client, method, path):
+    # Cold caches, so the view loads everything it renders.
+    cache.init_app(client.application)
+    with Reads() as reads:
+        response = client.open(path, method=method)
+        response.get_data()
+        response.close()
+    assert response.status_code == 200, path
+    return reads
+
+
+def budget(app, endpoint):
+    return app.view_functions[endpoint].query_budget
+
+
+@pytest.mark.parametrize('model, owner_column, endpoint, prefix', [
+    (Venue, Show.venue_id, 'show_venue', '/venues'),
+    (Artist, Show.artist_id, 'show_artist', '/artists'),
+])
+def test_detail_page(app, client, model, owner_column, endpoint, prefix):
+    ident, shows, genres = busiest(model, owner_column)
+    reads = read(client, 'GET', f'{prefix}/{ident}')
+    assert reads.statements <= budget(app, endpoint)
+    # Validator row, entity row, genre names and one row per show.
+    assert reads.rows <= 2 + genres + shows
+
+
+@pytest.mark.parametrize('model, endpoint, path', [
+    (Venue, 'edit_venue', '/venues/{}/edit'),
+    (Artist, 'edit_artist', '/artists/{}/edit'),
+])
+def test_edit_form(app, client, model, endpoint, path):
+    ident, shows, genres = busiest(
+        model, Show.venue_id if model is Venue else Show.artist_id)
+    reads = read(client, 'GET', path.format(ident))
+    assert reads.statements <= budget(app, endpoint)
+    # No show rows.
+    assert reads.rows <= 1 + genres
+
+
+def test_index(app, client):
+    reads = read(client, 'GET', '/')
+    assert reads.statements <= budget(app, 'index')
+    # Ten recent venues and ten recent artists.
+    assert reads.rows <= 20
+
+
+def test_delete_venue(app, client):
+    # Not the busiest venue, which the detail page test reads.
+    ident, shows, genres = busiest(Venue, Show.venue_id, offset=1)
+    reads = read(client, 'DELETE', f'/venues/{ident}')
+    assert reads.statements <= budget(app, 'delete_venue')
+    # The venue, its shows (deleted with it), its genres and the
+    # upcoming-show watermark (counters.py).
+    assert reads.rows <= 2 + shows + genres
+    assert db.session.query(Venue).get(ident) is None
+    db.session.remove()
@@ -0,0 +1,105 @@
+import pytest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+import pagination
+import seed
+from cache import cache
+from models import db, Venue, Show
+
+# The indexes of the hot query predicates (migration a41e7c9d2b58 and its
+# followers), checked in the plans of the statements routes actually run:
+# each route's SELECTs are captured, EXPLAINed on the same connection and
+# their plans searched for the index. Only at 100k shows and up; on small
+# tables the planner rightly prefers sequential scans.
+
+MIN_SHOWS = 100000
+
+
+class Statements(object):
+    # The SELECTs run while active, with their parameters.
+
+    def __init__(self):
+        self.selects = []
+
+    def __call__(self, conn, cursor, statement, parameters, context,
+                 executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            self.selects.append((statement, parameters))
+
+    def __enter__(self):
+        event.listen(Engine, 'before_cursor_execute', self)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(Engine, 'before_cursor_execute', self)
+
+
+def index_names(plan):
+    names = set()
+    if 'Index Name' in plan:
+        names.add(plan['Index Name'])
+    for child in plan.get('Plans', []):
+        names |= index_names(child)
+    return names
+
+
+def plan_indexes(client, path):
+    # Index names in the plans of every SELECT ``path`` runs.
+    cache.init_app(client.application)
+    with Statements() as statements:
+        response = client.get(path)
+        response.get_data()
+        response.close()
+    assert response.status_code == 200, path
+    names = set()
+    with db.engine.connect() as connection:
+        for statement, parameters in statements.selects:
+            plan = connection.exec_driver_sql(
+                'EXPLAIN (FORMAT JSON) ' + statement, parameters).scalar()
+            names |= index_names(plan[0]['Plan'])
+    return names
+
+
+@pytest.fixture
+def large(seeded):
+    if seed.SCALES[seeded] < MIN_SHOWS:
+        pytest.skip(f'{seeded} shows: too few for index plans')
+
+
+def busiest(owner_column):
+    ident = db.session.query(owner_column)\
+        .group_by(owner_column)\
+        .order_by(db.func.count(Show.id).desc(), owner_column).first()[0]
+    db.session.remove()
+    return ident
+
+
+def test_venue_timeline(client, large):
+    path = f'/venues/{busiest(Show.venue_id)}'
+    assert 'ix_Show_venue_id_start_time' in plan_indexes(client, path)
+
+
+def test_artist_timeline(client, large):
+    path = f'/artists/{busiest(Show.artist_id)}'
+    assert 'ix_Show_artist_id_start_time' in plan_indexes(client, path)
+
+
+def test_venues_pages(client, large):
+    assert 'ix_Venue_city_state_id' in plan_indexes(client, '/venues')
+    # A page from the middle, through the keyset cursor.
+    venue = Venue.query.order_by(Venue.city, Venue.state, Venue.id)\
+        .offset(Venue.query.count() // 2).first()
+    cursor = pagination.encode_cursor([venue.city, venue.state, venue.id])
+    db.session.remove()
+    assert 'ix_Venue_city_state_id' in plan_indexes(
+        client, f'/venues?after={cursor}')
+
+
+def test_recent_listings(client, large):
+    names = plan_indexes(client, '/')
+    assert {'ix_Venue_created_date', 'ix_Artist_created_date'} <= names
+
+
+def test_shows_listing(client, large):
+    assert 'ix_Show_start_time_id' in plan_indexes(client, '/shows')
@@ -0,0 +1,47 @@
+import pytest
+
+from models import db, Venue, Artist
+from search import search
+from test_loading import Reads
+
+# Search results paged to the end through the API's cursors: every match
+# exactly once. Small pages, so ties in rank fall across page boundaries.
+
+
+@pytest.mark.parametrize('model, path, term', [
+    (Venue, '/api/v1/venues/search', 'hop'),
+    (Venue, '/api/v1/venues/search', 'the'),
+    (Artist, '/api/v1/artists/search', 'blue'),
+    (Artist, '/api/v1/artists/search', 'ma'),
+])
+def test_pages_to_the_end(client, small_pages, model, path, term):
+    query, sort = search(model, term)
+    matches = query.count()
+    db.session.remove()
+
+    ids, cursor = [], None
+    while True:
+        url = f'{path}?search_term={term}&fields=id'
+        if cursor:
+            url += f'&after={cursor}'
+        payload = client.get(url).get_json()
+        ids += [item['id'] for item in payload['data']]
+        cursor = payload['next']
+        if cursor is None:
+            break
+        assert len(ids) <= matches, 'a page repeated'
+
+    assert len(ids) == len(set(ids))
+    assert len(ids) == matches
+
+
+def test_count_only_when_asked(client):
+    path = '/api/v1/venues/search?search_term=the&fields=id'
+    with Reads() as reads:
+        payload = client.get(path).get_json()
+    assert 'count' not in payload
+    with Reads() as counted:
+        payload = client.get(path + '&with_count=1').get_json()
+    assert payload['count'] >= 0
+    # The estimate is the one extra statement.
+    assert counted.statements == reads.statements + 1